@@ -0,0 +1,253 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import Header, HTTPException
+
+from app import metrics, stats
+
+# Admission control.
+#
+# Every route belongs to a class: "cheap" (spellcheck, DOCX export), "llm"
+# (Groq / Gemini backed) or "heavy" (local seq2seq models). Each class has a
+# concurrency cap and a bounded queue, both measured in cost units, so one
+# long document counts for more than a short sentence. A request estimates its
+# cost up front (estimate_cost: input size and generation params) and waits
+# until it fits under the class's cap; a request bigger than the cap on its
+# own still runs, alone. Waiters are served by priority, then arrival order.
+#
+# When the queue is full the request is shed with 503 and a Retry-After
+# derived from the recent service rate. Low-priority work (X-Priority: low,
+# or routes that default to it) is shed earlier, once the queue is
+# ADMISSION_<CLASS>_SHED_LOW_AT full, which keeps room for interactive work.
+#
+# Queue wait and service time are recorded separately, as the
+# textcraft_admission_wait_seconds and textcraft_admission_service_seconds
+# histograms, and queue wait also shows up as the `admission_wait` stage in
+# Server-Timing.
+PRIORITIES = {"normal": 0, "low": 1}
+
+CLASS_DEFAULTS = {
+    # name: (max inflight cost, max queued cost)
+    "cheap": (64, 512),
+    "llm": (32, 256),
+    "heavy": (8, 64),
+}
+
+ADMISSION_WAIT = metrics.Histogram(
+    "textcraft_admission_wait_seconds", "Time spent queued before admission.", ("class", "priority")
+)
+ADMISSION_SERVICE = metrics.Histogram(
+    "textcraft_admission_service_seconds", "Time from admission to completion.", ("class",)
+)
+ADMISSION_SHED = metrics.Counter(
+    "textcraft_admission_shed_total", "Requests rejected by admission control.", ("class", "priority")
+)
+
+
+def _class_setting(name: str, setting: str, default: float) -> float:
+    return float(os.getenv(f"ADMISSION_{name.upper()}_{setting}", str(default)))
+
+
+def estimate_cost(input_chars: int = 0, output_tokens: int = 0, num_beams: int = 1, num_return_sequences: int = 1) -> float:
+    # Roughly one unit per 1000 input tokens (~4 chars each) plus one per 256
+    # decoded tokens across all beams; never below one unit
+    input_units = input_chars / 4000
+    output_units = output_tokens * max(num_beams, num_return_sequences, 1) / 256
+    return max(1.0, input_units + output_units)
+
+
+class Overloaded(Exception):
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("rank", "seq", "cost", "future", "active")
+
+    def __init__(self, rank, seq, cost, future):
+        self.rank = rank
+        self.seq = seq
+        self.cost = cost
+        self.future = future
+        self.active = True
+
+    def __lt__(self, other):
+        return (self.rank, self.seq) < (other.rank, other.seq)
+
+
+class Ticket:
+    __slots__ = ("admission_class", "cost", "wait", "admitted_at", "released")
+
+    def __init__(self, admission_class, cost, wait):
+        self.admission_class = admission_class
+        self.cost = cost
+        self.wait = wait
+        self.admitted_at = time.perf_counter()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self.admission_class.release(self)
+
+
+class AdmissionClass:
+    def __init__(self, name: str, max_inflight: float, max_queue: float, shed_low_at: float = 0.5):
+        self.name = name
+        self.max_inflight = _class_setting(name, "MAX_INFLIGHT", max_inflight)
+        self.max_queue = _class_setting(name, "MAX_QUEUE", max_queue)
+        self.shed_low_at = _class_setting(name, "SHED_LOW_AT", shed_low_at)
+        self.inflight = 0.0
+        self.queued = 0.0
+        # Counts as well as costs: float sums drift, these decide "idle"
+        self.running = 0
+        self.waiting = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._seconds_per_cost = 0.0
+
+        self._admitted = 0
+        self._shed = 0
+        self._wait_total = 0.0
+        self._service_total = 0.0
+
+    def _fits(self, cost: float) -> bool:
+        return self.running == 0 or self.inflight + cost <= self.max_inflight
+
+    def retry_after(self) -> int:
+        # Time for the work already queued and running to drain at the recent rate
+        backlog = self.queued + self.inflight
+        seconds = backlog * self._seconds_per_cost / max(self.max_inflight, 1)
+        return int(min(max(math.ceil(seconds), 1), 120))
+
+    def _shed_request(self, priority: str, message: str):
+        self._shed += 1
+        ADMISSION_SHED.inc(1, self.name, priority)
+        raise Overloaded(message, self.retry_after())
+
+    async def acquire(self, cost: float, priority: str = "normal") -> Ticket:
+        rank = PRIORITIES.get(priority, PRIORITIES["normal"])
+        if not self.waiting and self._fits(cost):
+            self.inflight += cost
+            self.running += 1
+            return self._admit(cost, priority, 0.0)
+
+        limit = self.max_queue if rank < PRIORITIES["low"] else self.max_queue * self.shed_low_at
+        # A request bigger than the whole queue may still wait at the head
+        # of an empty one; only a queue that is actually full sheds
+        if self.waiting and self.queued + cost > limit:
+            self._shed_request(priority, f"The server is busy ({self.name} queue is full), try again later.")
+
+        waiter = _Waiter(rank, next(self._seq), cost, asyncio.get_running_loop().create_future())
+        heapq.heappush(self._waiters, waiter)
+        self.queued += cost
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.active:
+                waiter.active = False
+                self.queued -= cost
+                self.waiting -= 1
+            elif waiter.future.done() and not waiter.future.cancelled():
+                # Admitted just as the client went away: hand the slot back
+                self.inflight -= cost
+                self.running -= 1
+            self._wake()
+            raise
+        return self._admit(cost, priority, time.perf_counter() - started)
+
+    def _admit(self, cost, priority, wait):
+        self._admitted += 1
+        self._wait_total += wait
+        ADMISSION_WAIT.observe(wait, self.name, priority)
+        metrics.add_timings({"admission_wait": wait})
+        return Ticket(self, cost, wait)
+
+    def _wake(self):
+        while self._waiters:
+            waiter = self._waiters[0]
+            if not waiter.active:
+                heapq.heappop(self._waiters)
+                continue
+            if not self._fits(waiter.cost):
+                break
+            heapq.heappop(self._waiters)
+            waiter.active = False
+            self.queued -= waiter.cost
+            self.waiting -= 1
+            self.inflight += waiter.cost
+            self.running += 1
+            waiter.future.set_result(None)
+
+    def release(self, ticket: Ticket):
+        service = time.perf_counter() - ticket.admitted_at
+        self._service_total += service
+        ADMISSION_SERVICE.observe(service, self.name)
+        per_cost = service / ticket.cost
+        self._seconds_per_cost = per_cost if not self._seconds_per_cost else 0.8 * self._seconds_per_cost + 0.2 * per_cost
+        self.inflight -= ticket.cost
+        self.running -= 1
+        self._wake()
+
+    def snapshot(self):
+        return {
+            "max_inflight": self.max_inflight,
+            "max_queue": self.max_queue,
+            "inflight_cost": round(self.inflight, 2),
+            "queued_cost": round(self.queued, 2),
+            "running": self.running,
+            "waiting": self.waiting,
+            "admitted": self._admitted,
+            "shed": self._shed,
+            "avg_wait_ms": round(1000 * self._wait_total / self._admitted, 2) if self._admitted else 0.0,
+            "avg_service_ms": round(1000 * self._service_total / self._admitted, 2) if self._admitted else 0.0,
+            "retry_after": self.retry_after(),
+        }
+
+
+classes = {name: AdmissionClass(name, *limits) for name, limits in CLASS_DEFAULTS.items()}
+stats.register("admission", lambda: {name: c.snapshot() for name, c in classes.items()})
+
+
+def request_priority(x_priority: Optional[str] = Header(None)) -> Optional[str]:
+    # Dependency: the client's X-Priority header, if it is a known priority
+    return x_priority.lower() if x_priority and x_priority.lower() in PRIORITIES else None
+
+
+async def acquire(route_class: str, cost: float = 1.0, priority: str = "normal") -> Ticket:
+    # Raises HTTPException(503) with Retry-After when the request is shed
+    try:
+        return await classes[route_class].acquire(cost, priority or "normal")
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+@asynccontextmanager
+async def admit(route_class: str, cost: float = 1.0, priority: str = "normal"):
+    # async with admission.admit("heavy", cost, priority): ...
+    ticket = await acquire(route_class, cost, priority)
+    try:
+        yield ticket
+    finally:
+        ticket.release()
+
+
+async def release_after(ticket: Ticket, stream):
+    # For streaming responses: holds the slot until the stream is finished.
+    # Pass BackgroundTask(ticket.release) to the response as well, which
+    # covers a client that leaves before the body is ever iterated.
+    try:
+        async for item in stream:
+            yield item
+    finally:
+        ticket.release()
+        await stream.aclose()
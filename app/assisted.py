@@ -0,0 +1,180 @@
+import logging
+import os
+import re
+import threading
+
+from app import metrics, stats
+from app.backends import backend_for, load_seq2seq
+from app.model_registry import registry
+
+logger = logging.getLogger(__name__)
+
+# Assisted (draft model) decoding.
+#
+# With ASSISTED_DRAFT_MODEL_<MODEL> set (e.g. ASSISTED_DRAFT_MODEL_SUMMARIZER
+# to a distilled Pegasus sharing pegasus-large's vocabulary), a small draft
+# model proposes a few tokens at a time and the full model checks them all in
+# one forward pass, keeping the ones it agrees with. For greedy decoding the
+# output is the same as plain generate; it only saves full-model decoder
+# steps. Beam search can't be assisted, so only num_beams=1 calls use it
+# (the `fast` quality tier, or SUMMARIZER_NUM_BEAMS=1), and only for batches of
+# at most ASSISTED_MAX_BATCH: assisted generate runs one sequence at a time,
+# and a larger padded batch is better served by one plain generate call.
+#
+# The draft pays off only while the full model accepts enough of its tokens.
+# The acceptance rate is tracked as a moving average; when it falls below
+# ASSISTED_MIN_ACCEPTANCE the draft is set aside for ASSISTED_PROBE_BATCHES
+# batches and then tried again.
+ASSISTED_MIN_ACCEPTANCE = float(os.getenv("ASSISTED_MIN_ACCEPTANCE", "0.4"))
+ASSISTED_MIN_SAMPLES = int(os.getenv("ASSISTED_MIN_SAMPLES", "5"))
+ASSISTED_PROBE_BATCHES = int(os.getenv("ASSISTED_PROBE_BATCHES", "50"))
+ASSISTED_MAX_BATCH = int(os.getenv("ASSISTED_MAX_BATCH", "2"))
+
+ACCEPTED_TOKENS = metrics.Counter(
+    "textcraft_assisted_accepted_tokens_total", "Draft tokens accepted by the full model.", ("model",)
+)
+PROPOSED_TOKENS = metrics.Counter(
+    "textcraft_assisted_proposed_tokens_total", "Tokens proposed by the draft model.", ("model",)
+)
+
+
+def draft_model_for(name: str):
+    return os.getenv("ASSISTED_DRAFT_MODEL_" + re.sub(r"[^A-Z0-9]", "_", name.upper())) or None
+
+
+class _ForwardCounter:
+    # Counts top-level forward calls made from this thread only; the models
+    # are shared with the other threads of the inference pool
+    def __init__(self, model):
+        self.count = 0
+        self._thread = threading.get_ident()
+        self._handle = model.register_forward_pre_hook(self._hook)
+
+    def _hook(self, module, args):
+        if threading.get_ident() == self._thread:
+            self.count += 1
+
+    def remove(self):
+        self._handle.remove()
+
+
+class AssistedDecoder:
+    def __init__(self, name: str, draft_model: str):
+        self.name = name
+        self.draft_name = f"{name}_draft"
+        self.draft_model = draft_model
+        self._lock = threading.Lock()
+        self._acceptance = None
+        self._samples = 0
+        self._paused_for = 0
+        self._broken = None
+
+        self._assisted_batches = 0
+        self._plain_batches = 0
+        self._fallbacks = 0
+        self._accepted = 0
+        self._proposed = 0
+
+        registry.register(self.draft_name, self._load_draft)
+        stats.register(f"assisted.{name}", self.snapshot)
+
+    def _load_draft(self):
+        from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+        # The draft is handed to transformers' generate, so it has to be a
+        # PyTorch model: int8 works, ONNX doesn't
+        backend = "eager" if backend_for(self.draft_name) == "onnx" else None
+        return load_seq2seq(self.draft_name, self.draft_model, AutoModelForSeq2SeqLM, AutoTokenizer, backend=backend)
+
+    def should_use(self, batch_size: int, generate_kwargs: dict) -> bool:
+        if self._broken or batch_size > ASSISTED_MAX_BATCH:
+            return False
+        # num_beams must be explicit: model configs often default to beams
+        if generate_kwargs.get("num_beams") != 1 or generate_kwargs.get("num_return_sequences", 1) != 1:
+            return False
+        with self._lock:
+            if self._paused_for:
+                self._paused_for -= 1
+                self._plain_batches += 1
+                if not self._paused_for:
+                    # Probe again from a clean slate
+                    self._acceptance = None
+                    self._samples = 0
+                return False
+        return True
+
+    def check(self, model, draft) -> bool:
+        # A draft with a different vocabulary, or a model without forward
+        # hooks (ONNX), can't be used at all
+        if self._broken is None:
+            if not hasattr(model, "register_forward_pre_hook"):
+                self._broken = f"{self.name} backend is not a PyTorch model"
+            elif model.config.vocab_size != draft.config.vocab_size:
+                self._broken = f"draft vocabulary ({draft.config.vocab_size}) differs from {self.name}'s ({model.config.vocab_size})"
+            else:
+                self._broken = ""
+            if self._broken:
+                logger.warning("assisted decoding disabled for %s: %s", self.name, self._broken)
+        return not self._broken
+
+    def generate(self, tokenizer, model, draft, ids_list, generate_kwargs):
+        # Runs on the inference pool: one assisted generate per sequence.
+        # Returns the output id rows and the number of generated tokens.
+        import torch
+
+        rows = []
+        generated = target_steps = proposed = 0
+        for input_ids in ids_list:
+            target, assistant = _ForwardCounter(model), _ForwardCounter(draft)
+            try:
+                output_ids = model.generate(
+                    input_ids=torch.tensor([input_ids]), assistant_model=draft, **generate_kwargs
+                )
+            finally:
+                target.remove()
+                assistant.remove()
+            rows.append(output_ids[0])
+            generated += int((output_ids[0] != tokenizer.pad_token_id).sum())
+            target_steps += target.count
+            proposed += assistant.count
+        # Every full-model step yields one token of its own on top of the
+        # draft tokens it accepted
+        self.record(max(generated - target_steps, 0), proposed)
+        return rows, generated
+
+    def record(self, accepted: int, proposed: int):
+        ACCEPTED_TOKENS.inc(accepted, self.name)
+        PROPOSED_TOKENS.inc(proposed, self.name)
+        with self._lock:
+            self._assisted_batches += 1
+            self._accepted += accepted
+            self._proposed += proposed
+            if not proposed:
+                return
+            rate = accepted / proposed
+            self._samples += 1
+            self._acceptance = rate if self._acceptance is None else 0.8 * self._acceptance + 0.2 * rate
+            if self._samples >= ASSISTED_MIN_SAMPLES and self._acceptance < ASSISTED_MIN_ACCEPTANCE:
+                logger.info(
+                    "%s draft acceptance %.2f is below %.2f, decoding without it for %d batches",
+                    self.name, self._acceptance, ASSISTED_MIN_ACCEPTANCE, ASSISTED_PROBE_BATCHES,
+                )
+                self._fallbacks += 1
+                self._paused_for = ASSISTED_PROBE_BATCHES
+
+    def snapshot(self):
+        return {
+            "draft_model": self.draft_model,
+            "active": not self._broken and not self._paused_for,
+            "disabled_reason": self._broken or None,
+            "acceptance": round(self._acceptance, 3) if self._acceptance is not None else None,
+            "overall_acceptance": round(self._accepted / self._proposed, 3) if self._proposed else None,
+            "assisted_batches": self._assisted_batches,
+            "plain_batches_while_paused": self._plain_batches,
+            "fallbacks": self._fallbacks,
+        }
+
+
+def assisted_decoder(name: str):
+    draft_model = draft_model_for(name)
+    return AssistedDecoder(name, draft_model) if draft_model else None
@@ -0,0 +1,106 @@
+import argparse
+import os
+import re
+
+from app.resources import missing_model_error
+
+# Pluggable CPU inference backends for the seq2seq models.
+#
+#   eager  - fp32 PyTorch, as loaded by from_pretrained
+#   int8   - PyTorch with every nn.Linear dynamically quantized to int8
+#   onnx   - ONNX Runtime graph exported with optimum, with separate cached
+#            encoder / decoder / decoder-with-past sessions
+#
+# The backend is chosen per model with INFERENCE_BACKEND_<MODEL> (e.g.
+# INFERENCE_BACKEND_SUMMARIZER=onnx), falling back to INFERENCE_BACKEND.
+# ONNX exports are cached under BACKEND_CACHE_DIR; create them ahead of time
+# with `python -m app.backends convert <model name>...`, or set
+# BACKEND_AUTO_CONVERT=1 to export on first load.
+BACKENDS = ("eager", "int8", "onnx")
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "eager")
+BACKEND_CACHE_DIR = os.getenv("BACKEND_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "textcraft", "backends"))
+BACKEND_AUTO_CONVERT = os.getenv("BACKEND_AUTO_CONVERT", "0") == "1"
+ONNX_INTRA_OP_THREADS = int(os.getenv("ONNX_INTRA_OP_THREADS", "0"))  # 0 lets ONNX Runtime decide
+
+
+def backend_for(name: str) -> str:
+    env_key = "INFERENCE_BACKEND_" + re.sub(r"[^A-Z0-9]", "_", name.upper())
+    backend = os.getenv(env_key, INFERENCE_BACKEND).lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"{env_key}={backend!r}: expected one of {', '.join(BACKENDS)}")
+    return backend
+
+
+def onnx_dir(model_name: str) -> str:
+    return os.path.join(BACKEND_CACHE_DIR, "onnx", model_name.replace("/", "--"))
+
+
+def export_onnx(model_name: str) -> str:
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    from transformers import AutoTokenizer
+
+    path = onnx_dir(model_name)
+    model = ORTModelForSeq2SeqLM.from_pretrained(model_name, export=True, use_cache=True)
+    model.save_pretrained(path)
+    AutoTokenizer.from_pretrained(model_name).save_pretrained(path)
+    return path
+
+
+def load_onnx(model_name: str):
+    import onnxruntime
+    from optimum.onnxruntime import ORTModelForSeq2SeqLM
+
+    path = onnx_dir(model_name)
+    if not os.path.isdir(path):
+        if not BACKEND_AUTO_CONVERT:
+            raise RuntimeError(
+                f"No ONNX export for {model_name} in {path}. "
+                f"Run `python -m app.backends convert {model_name}` or set BACKEND_AUTO_CONVERT=1."
+            )
+        export_onnx(model_name)
+
+    session_options = onnxruntime.SessionOptions()
+    session_options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    if ONNX_INTRA_OP_THREADS:
+        session_options.intra_op_num_threads = ONNX_INTRA_OP_THREADS
+    return ORTModelForSeq2SeqLM.from_pretrained(
+        path, use_cache=True, provider="CPUExecutionProvider", session_options=session_options
+    )
+
+
+def quantize_int8(model):
+    import torch
+
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def load_seq2seq(name: str, model_name: str, model_cls, tokenizer_cls, backend: str = None):
+    # Returns (tokenizer, model) for the backend configured for `name`
+    backend = backend or backend_for(name)
+    try:
+        tokenizer = tokenizer_cls.from_pretrained(model_name)
+        if backend == "onnx":
+            return tokenizer, load_onnx(model_name)
+
+        model = model_cls.from_pretrained(model_name).eval()
+    except OSError as e:
+        # Raised by from_pretrained when the checkpoint isn't cached offline
+        raise missing_model_error(model_name, e) from e
+    if backend == "int8":
+        model = quantize_int8(model)
+    return tokenizer, model
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prepare cached inference backends")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    convert = subparsers.add_parser("convert", help="export models to ONNX into BACKEND_CACHE_DIR")
+    convert.add_argument("models", nargs="+")
+    args = parser.parse_args()
+
+    for model_name in args.models:
+        print(f"Exporting {model_name} -> {export_onnx(model_name)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,283 @@
+import asyncio
+import os
+import re
+import time
+from collections import deque
+from contextlib import AsyncExitStack
+
+from app import metrics, stats
+from app.assisted import assisted_decoder
+from app.inference import pool_size, run_inference
+from app.model_registry import registry
+
+# Dynamic micro-batching for seq2seq generate calls.
+#
+# Requests for the same model that arrive within a short window are grouped
+# into one padded `model.generate` call. Requests are only grouped with others
+# that use identical generation params and a similar input length (same
+# length bucket), which keeps padding waste low. A batch is sealed when it
+# reaches BATCH_MAX_SIZE requests, when its padded size would exceed
+# BATCH_MAX_TOKENS, or when its oldest request has waited BATCH_MAX_WAIT_MS.
+# Sealed batches run on the model's inference pool, at most one batch per pool
+# thread; while those are busy new arrivals keep accumulating.
+#
+# Every knob can be set globally (BATCH_MAX_SIZE) or per model
+# (BATCH_MAX_SIZE_SUMMARIZER). The tokenizer and model are taken from the
+# model registry for every batch, so they are loaded on first use. Small
+# greedy batches go through the model's draft model when one is configured
+# (see app/assisted.py).
+
+
+def _setting(var: str, name: str, default):
+    env_key = var + "_" + re.sub(r"[^A-Z0-9]", "_", name.upper())
+    value = os.getenv(env_key, os.getenv(var))
+    return type(default)(value) if value is not None else default
+
+
+class QueueFullError(RuntimeError):
+    pass
+
+
+class _Pending:
+    __slots__ = ("input_ids", "future", "enqueued_at", "route", "timings")
+
+    def __init__(self, input_ids, future):
+        self.input_ids = input_ids
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+        self.route = metrics.current_route()
+        self.timings = {}
+
+
+class _Bucket:
+    __slots__ = ("generate_kwargs", "items", "max_len", "timer")
+
+    def __init__(self, generate_kwargs):
+        self.generate_kwargs = generate_kwargs
+        self.items = []
+        self.max_len = 0
+        self.timer = None
+
+    def padded_tokens(self, extra_len=0):
+        return (len(self.items) + 1) * max(self.max_len, extra_len)
+
+
+# Every scheduler by model name, used by the startup warm-up
+schedulers = {}
+
+
+class BatchScheduler:
+    def __init__(self, name: str):
+        self.name = name
+
+        self.max_batch_size = _setting("BATCH_MAX_SIZE", name, 8)
+        self.max_wait = _setting("BATCH_MAX_WAIT_MS", name, 10.0) / 1000
+        self.max_tokens = _setting("BATCH_MAX_TOKENS", name, 8192)
+        self.max_queue = _setting("BATCH_MAX_QUEUE", name, 256)
+        self.length_bucket = _setting("BATCH_LENGTH_BUCKET", name, 64)
+        self.max_inflight = pool_size(name)
+        self.assisted = assisted_decoder(name)
+
+        self._open = {}
+        self._sealed = deque()
+        self._tasks = set()
+        self._queued = 0
+        self._inflight = 0
+
+        self._batches = 0
+        self._items = 0
+        self._rejected = 0
+        self._wait_total = 0.0
+        self._real_tokens = 0
+        self._padded_tokens = 0
+        self._recent_latency = 0.0
+
+        schedulers[name] = self
+        stats.register(f"batching.{name}", self.snapshot)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queued
+
+    @property
+    def inflight_batches(self) -> int:
+        return self._inflight
+
+    @property
+    def recent_latency(self) -> float:
+        # Moving average of queue wait plus generate time per batch, in seconds
+        return self._recent_latency
+
+    async def submit(self, text: str, max_input_length: int = 1024, **generate_kwargs) -> list:
+        # Returns the decoded outputs for `text` (num_return_sequences strings)
+        encoded = await self.run_with_tokenizer(
+            lambda tokenizer: tokenizer(text, truncation=True, max_length=max_input_length)
+        )
+        return await self.submit_ids(encoded["input_ids"], **generate_kwargs)
+
+    async def run_with_tokenizer(self, fn):
+        # Runs fn(tokenizer) on the model's inference pool; the time it takes
+        # there is recorded as the `tokenize` stage
+        def timed(tokenizer):
+            started = time.perf_counter()
+            return fn(tokenizer), time.perf_counter() - started
+
+        async with registry.use(self.name) as (tokenizer, _):
+            result, seconds = await run_inference(self.name, timed, tokenizer)
+        metrics.observe("tokenize", seconds, model=self.name)
+        return result
+
+    async def submit_ids(self, input_ids: list, **generate_kwargs) -> list:
+        if self._queued >= self.max_queue:
+            self._rejected += 1
+            raise QueueFullError(f"{self.name} inference queue is full, try again later")
+
+        loop = asyncio.get_running_loop()
+        pending = _Pending(input_ids, loop.create_future())
+
+        key = (tuple(sorted(generate_kwargs.items())), len(input_ids) // self.length_bucket)
+        bucket = self._open.get(key)
+        if bucket is not None and bucket.padded_tokens(len(input_ids)) > self.max_tokens:
+            self._seal(key)
+            bucket = None
+        if bucket is None:
+            bucket = self._open[key] = _Bucket(generate_kwargs)
+            bucket.timer = loop.call_later(self.max_wait, self._seal, key)
+
+        bucket.items.append(pending)
+        bucket.max_len = max(bucket.max_len, len(input_ids))
+        self._queued += 1
+        metrics.count_tokens(input_tokens=len(input_ids), model=self.name)
+        if len(bucket.items) >= self.max_batch_size:
+            self._seal(key)
+
+        result = await pending.future
+        metrics.add_timings(pending.timings)
+        return result
+
+    async def submit_batch(self, ids_list: list, **generate_kwargs) -> list:
+        # Runs a batch the caller already formed (e.g. length-sorted) as-is,
+        # without the collection window, but queued behind earlier batches
+        if self._queued + len(ids_list) > self.max_queue:
+            self._rejected += len(ids_list)
+            raise QueueFullError(f"{self.name} inference queue is full, try again later")
+
+        loop = asyncio.get_running_loop()
+        bucket = _Bucket(generate_kwargs)
+        for input_ids in ids_list:
+            bucket.items.append(_Pending(input_ids, loop.create_future()))
+            bucket.max_len = max(bucket.max_len, len(input_ids))
+        self._queued += len(ids_list)
+        metrics.count_tokens(input_tokens=sum(len(ids) for ids in ids_list), model=self.name)
+        self._sealed.append(bucket)
+        self._dispatch()
+        results = await asyncio.gather(*(p.future for p in bucket.items))
+        metrics.add_timings(bucket.items[0].timings)
+        return results
+
+    def _seal(self, key):
+        bucket = self._open.pop(key, None)
+        if bucket is None:
+            return
+        bucket.timer.cancel()
+        self._sealed.append(bucket)
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._sealed and self._inflight < self.max_inflight:
+            bucket = self._sealed.popleft()
+            self._inflight += 1
+            self._queued -= len(bucket.items)
+            task = asyncio.ensure_future(self._run(bucket))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, bucket):
+        items = bucket.items
+        now = time.perf_counter()
+        self._batches += 1
+        self._items += len(items)
+        self._wait_total += sum(now - p.enqueued_at for p in items)
+        self._real_tokens += sum(len(p.input_ids) for p in items)
+        self._padded_tokens += len(items) * bucket.max_len
+
+        # This task runs in the context of whichever request sealed the batch,
+        # so stages are recorded directly rather than through metrics.observe
+        routes = {p.route for p in items}
+        route = routes.pop() if len(routes) == 1 else "mixed"
+        for p in items:
+            p.timings["queue"] = now - p.enqueued_at
+            metrics.STAGE_SECONDS.observe(p.timings["queue"], "queue", p.route, self.name)
+
+        assisted = self.assisted
+        if assisted is not None and not assisted.should_use(len(items), bucket.generate_kwargs):
+            assisted = None
+        try:
+            async with AsyncExitStack() as stack:
+                tokenizer, model = await stack.enter_async_context(registry.use(self.name))
+                draft = None
+                if assisted is not None:
+                    _, draft = await stack.enter_async_context(registry.use(assisted.draft_name))
+                    if not assisted.check(model, draft):
+                        draft = None
+                outputs, generate_seconds, decode_seconds, output_tokens = await run_inference(
+                    self.name, self._generate, tokenizer, model, [p.input_ids for p in items], bucket.generate_kwargs, draft
+                )
+        except Exception as e:
+            metrics.count_error("generate", route=route)
+            for p in items:
+                if not p.future.done():
+                    p.future.set_exception(e)
+        else:
+            # One generate call serves the whole batch, so it is recorded once
+            metrics.STAGE_SECONDS.observe(generate_seconds, "generate", route, self.name)
+            metrics.STAGE_SECONDS.observe(decode_seconds, "decode", route, self.name)
+            metrics.count_tokens(output_tokens=output_tokens, model=self.name, route=route)
+            latency = max(p.timings["queue"] for p in items) + generate_seconds + decode_seconds
+            self._recent_latency = latency if not self._recent_latency else 0.8 * self._recent_latency + 0.2 * latency
+            for p, output in zip(items, outputs):
+                p.timings["generate"] = generate_seconds
+                p.timings["decode"] = decode_seconds
+                if not p.future.done():
+                    p.future.set_result(output)
+        finally:
+            self._inflight -= 1
+            self._dispatch()
+
+    def _generate(self, tokenizer, model, ids_list, generate_kwargs, draft=None):
+        # Runs on the inference pool: pad, generate once, split per caller.
+        # Also returns the generate and decode times and the tokens generated.
+        started = time.perf_counter()
+        if draft is not None:
+            output_ids, output_tokens = self.assisted.generate(tokenizer, model, draft, ids_list, generate_kwargs)
+        else:
+            batch = tokenizer.pad({"input_ids": ids_list}, padding="longest", return_tensors="pt")
+            output_ids = model.generate(
+                input_ids=batch["input_ids"],
+                attention_mask=batch["attention_mask"],
+                **generate_kwargs,
+            )
+            output_tokens = int((output_ids != tokenizer.pad_token_id).sum())
+        generated = time.perf_counter()
+        texts = tokenizer.batch_decode(output_ids, skip_special_tokens=True)
+        decoded = time.perf_counter()
+        n = generate_kwargs.get("num_return_sequences", 1)
+        outputs = [texts[i * n:(i + 1) * n] for i in range(len(ids_list))]
+        return outputs, generated - started, decoded - generated, output_tokens
+
+    def snapshot(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "max_tokens": self.max_tokens,
+            "max_queue": self.max_queue,
+            "queue_depth": self._queued,
+            "inflight_batches": self._inflight,
+            "batches": self._batches,
+            "items": self._items,
+            "rejected": self._rejected,
+            "avg_batch_size": self._items / self._batches if self._batches else 0.0,
+            "avg_wait_ms": 1000 * self._wait_total / self._items if self._items else 0.0,
+            "padding_ratio": 1 - self._real_tokens / self._padded_tokens if self._padded_tokens else 0.0,
+            "recent_latency_ms": 1000 * self._recent_latency,
+        }
@@ -0,0 +1,229 @@
+import asyncio
+import hashlib
+import json
+import os
+import pickle
+import re
+import tempfile
+import time
+from collections import OrderedDict
+
+from app import stats
+
+# Content-addressed result cache.
+#
+# Keys are a hash of (endpoint, model, normalized input, generation params),
+# so re-submitting the same text or file with the same settings is served
+# without recomputation. Each cache has an in-memory LRU tier bounded by entry
+# count and TTL, plus an optional on-disk tier (RESULT_CACHE_DIR) that
+# survives restarts. Concurrent misses for the same key are coalesced: only
+# the first caller computes, the rest await its result.
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "1024"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "3600"))
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR")
+
+_whitespace = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return _whitespace.sub(" ", text).strip()
+
+
+def cache_key(endpoint: str, model: str, data, **params) -> str:
+    # `data` is text (normalized before hashing) or raw bytes such as an upload
+    digest = hashlib.sha256()
+    digest.update(json.dumps([endpoint, model, params], sort_keys=True, default=str).encode())
+    digest.update(b"\0")
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        digest.update(data)
+    else:
+        digest.update(normalize_text(data).encode())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, name: str, max_entries: int = RESULT_CACHE_MAX_ENTRIES, ttl: float = RESULT_CACHE_TTL,
+                 disk_dir: str = RESULT_CACHE_DIR):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_dir = os.path.join(disk_dir, name) if disk_dir else None
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+
+        self._entries = OrderedDict()
+        self._inflight = {}
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        stats.register(f"cache.{name}", self.snapshot)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, key[:2], key + ".pkl")
+
+    def _read_disk(self, key):
+        path = self._disk_path(key)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def _write_disk(self, key, value):
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write-then-rename so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def get(self, key):
+        # Returns (found, value) from the memory tier only
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def put(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_compute(self, key: str, compute):
+        # `compute` is a zero-argument coroutine function, only called on a miss
+        found, value = self.get(key)
+        if found:
+            self.hits += 1
+            return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            # The computation runs as its own task so a caller that goes away
+            # (client disconnect) doesn't cancel it for everyone else waiting
+            task = asyncio.ensure_future(self._fill(key, compute))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._done(key, t))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    async def _fill(self, key, compute):
+        if self.disk_dir:
+            value = await asyncio.to_thread(self._read_disk, key)
+            if value is not None:
+                self.disk_hits += 1
+                self.put(key, value)
+                return value
+
+        self.misses += 1
+        value = await compute()
+        self.put(key, value)
+        if self.disk_dir:
+            await asyncio.to_thread(self._write_disk, key, value)
+        return value
+
+    async def get_many(self, keys: list):
+        # Batch form of get_or_compute, for callers that compute their misses
+        # together (e.g. one padded generate call). Returns (found, pending,
+        # owned): values from either tier by key, futures for keys another
+        # caller is already computing, and the keys this caller now computes.
+        # Every owned key must be finished with fill() or fail().
+        found, pending, candidates = {}, {}, []
+        for key in dict.fromkeys(keys):
+            hit, value = self.get(key)
+            if hit:
+                self.hits += 1
+                found[key] = value
+            elif key in self._inflight:
+                self.coalesced += 1
+                pending[key] = self._inflight[key]
+            else:
+                candidates.append(key)
+
+        loop = asyncio.get_running_loop()
+        for key in candidates:
+            future = self._inflight[key] = loop.create_future()
+            future.add_done_callback(lambda f, key=key: self._done(key, f))
+
+        owned = candidates
+        if self.disk_dir and candidates:
+            try:
+                values = await asyncio.to_thread(lambda: [self._read_disk(key) for key in candidates])
+            except BaseException as e:
+                for key in candidates:
+                    self.fail(key, e)
+                raise
+            owned = []
+            for key, value in zip(candidates, values):
+                if value is None:
+                    owned.append(key)
+                else:
+                    self.disk_hits += 1
+                    self.put(key, value)
+                    self._inflight[key].set_result(value)
+                    found[key] = value
+        self.misses += len(owned)
+        return found, pending, owned
+
+    async def fill(self, key, value):
+        # Stores an owned key's value in both tiers and hands it to its waiters
+        self.put(key, value)
+        future = self._inflight.get(key)
+        if future is not None and not future.done():
+            future.set_result(value)
+        if self.disk_dir:
+            await asyncio.to_thread(self._write_disk, key, value)
+
+    def fail(self, key, error: BaseException):
+        # Gives up an owned key: its waiters get the error, nothing is cached
+        future = self._inflight.get(key)
+        if future is not None and not future.done():
+            if isinstance(error, asyncio.CancelledError):
+                future.cancel()
+            else:
+                future.set_exception(error)
+
+    def _done(self, key, task):
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            # Failures are never cached; retrieve them so an abandoned task
+            # doesn't log "exception was never retrieved"
+            task.exception()
+
+    def clear(self):
+        self._entries.clear()
+
+    def snapshot(self):
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "disk": self.disk_dir is not None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
@@ -0,0 +1,35 @@
+# Sentence-aware chunking for inputs longer than a model's context window.
+
+
+def split_sentences(text: str) -> list:
+    # nltk is slow to import, so it is only loaded when first needed
+    import nltk
+
+    return nltk.sent_tokenize(text)
+
+
+def chunk_sentences(sentences: list, lengths: list, max_tokens: int, overlap_tokens: int = 0) -> list:
+    # Greedily packs whole sentences into chunks of at most `max_tokens`
+    # (`lengths` holds each sentence's token count). Each new chunk starts with
+    # the trailing sentences of the previous one, up to `overlap_tokens`, so
+    # context isn't lost at the boundary. A single sentence longer than
+    # `max_tokens` becomes its own chunk and is truncated by the tokenizer.
+    chunks = []
+    current = []
+    current_len = 0
+    for sentence, n in zip(sentences, lengths):
+        if current and current_len + n > max_tokens:
+            chunks.append(" ".join(s for s, _ in current))
+            carry = []
+            carry_len = 0
+            for s, m in reversed(current):
+                if carry_len + m > overlap_tokens or carry_len + m + n > max_tokens:
+                    break
+                carry.insert(0, (s, m))
+                carry_len += m
+            current, current_len = carry, carry_len
+        current.append((sentence, n))
+        current_len += n
+    if current:
+        chunks.append(" ".join(s for s, _ in current))
+    return chunks
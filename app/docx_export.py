@@ -0,0 +1,69 @@
+import copy
+import re
+from io import BytesIO
+
+from docx import Document
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls, qn
+from docx.shared import Pt
+
+# In-memory DOCX export for literature reviews.
+#
+# python-docx's `table.add_row().cells` rescans the whole table for every
+# row, which makes large tables quadratic. Instead one template row is built
+# through the normal API, and every data row is a deep copy of it with the
+# cell text written straight into the XML. The document is saved into a
+# BytesIO, so nothing is written to disk.
+
+HEADERS = ("Paper Name", "Publication Year", "Author Names", "Summary")
+
+# Characters that are not allowed in XML 1.0 documents
+_invalid_xml_chars = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+
+def _set_cell_text(tc, text: str):
+    # Equivalent of `cell.text = text` on a fresh cell, newlines become breaks
+    p = tc.find(qn("w:p"))
+    r = p.makeelement(qn("w:r"), {})
+    for i, line in enumerate(_invalid_xml_chars.sub("", text).split("\n")):
+        if i:
+            r.append(r.makeelement(qn("w:br"), {}))
+        t = r.makeelement(qn("w:t"), {})
+        t.text = line
+        t.set("{http://www.w3.org/XML/1998/namespace}space", "preserve")
+        r.append(t)
+    p.append(r)
+
+
+def build_papers_docx(topic: str, rows) -> bytes:
+    # `rows` yields (title, year, authors, summary) tuples
+    doc = Document()
+
+    # Add a title
+    doc.add_heading(f"Summarized Papers for Topic: {topic}", level=1)
+
+    # Add a table for the papers
+    table = doc.add_table(rows=2, cols=len(HEADERS))
+    table.autofit = True
+    doc.styles["Normal"].font.size = Pt(11)
+
+    # Add and style the table headers
+    for cell, header in zip(table.rows[0].cells, HEADERS):
+        cell.text = header
+        shading_elm = parse_xml(r'<w:shd {} w:fill="CCCCCC"/>'.format(nsdecls("w")))
+        cell._element.get_or_add_tcPr().append(shading_elm)
+
+    # The second row is the blank template every data row is copied from
+    tbl = table._tbl
+    template = table.rows[1]._tr
+    tbl.remove(template)
+
+    for row in rows:
+        tr = copy.deepcopy(template)
+        for tc, value in zip(tr.iterchildren(qn("w:tc")), row):
+            _set_cell_text(tc, str(value))
+        tbl.append(tr)
+
+    buffer = BytesIO()
+    doc.save(buffer)
+    return buffer.getvalue()
@@ -1,12 +1,11 @@
-from fastapi import APIRouter, FastAPI
+from fastapi import APIRouter, Depends
 from pydantic import BaseModel
+from typing import Optional
+from starlette.background import BackgroundTask
 import json
-import requests
-import os
-from dotenv import load_dotenv
-
-# Load environment variables from the .env file
-load_dotenv()
+from app.admission import acquire, admit, release_after, request_priority
+from app.groq_client import chat_completion, stream_chat_completion, UpstreamError
+from app.streaming import sse_response
 
 # Initialize the API router
 router = APIRouter()
@@ -37,15 +36,7 @@ def create_email_prompt(email_length, tone, purpose, recipient_name, sender_name
     
     return template.strip()
 
-# Define endpoint to handle requests for email generation
-@router.post("/generate")
-async def generate_email(request: GenerateRequest):
-    url = "https://api.groq.com/openai/v1/chat/completions"  #  Groq API 
-    headers = {
-        "Authorization": f"Bearer {os.getenv('GROQ_API_KEY')}",  
-        "Content-Type": "application/json"
-    }
-    
+def create_email_messages(request: GenerateRequest):
     prompt = create_email_prompt(
         email_length=request.email_length,
         tone=request.tone,
@@ -54,29 +45,35 @@ async def generate_email(request: GenerateRequest):
         sender_name=request.sender_name,
         important_keywords=request.important_keywords
     )
-    print("Sending this data to the model API:", prompt)
-    
-    data = {
-        "model": "llama-3.1-8b-instant",  # Specify the model you want to use
-        "messages": [
-            {
-                "role": "system",
-                "content": "You are an email generation assistant."
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        "max_tokens": 4096
-    }
+
+    return [
+        {
+            "role": "system",
+            "content": "You are an email generation assistant."
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+
+# Define endpoint to handle requests for email generation
+@router.post("/generate")
+async def generate_email(request: GenerateRequest, priority: Optional[str] = Depends(request_priority)):
+    messages = create_email_messages(request)
 
     try:
-        response = requests.post(url, headers=headers, json=data)  # Use json parameter to send data
-        response.raise_for_status()
-        generated_email = response.json()
-        print("Generated Email Response:", generated_email)  
-    except requests.exceptions.RequestException as e:
+        async with admit("llm", priority=priority):
+            generated_email = await chat_completion(messages, max_tokens=4096)
+    except UpstreamError as e:
         return {"error": f"Request failed: {str(e)}"}
     
-    return {"generated_email": generated_email["choices"][0]["message"]["content"]}  # Extract generated email content
+    return {"generated_email": generated_email}
+
+# Streaming variant: relays the email token by token as Server-Sent Events
+@router.post("/generate/stream")
+async def generate_email_stream(request: GenerateRequest, priority: Optional[str] = Depends(request_priority)):
+    messages = create_email_messages(request)
+    ticket = await acquire("llm", priority=priority)
+    tokens = release_after(ticket, stream_chat_completion(messages, max_tokens=4096))
+    return sse_response(tokens, error_types=(UpstreamError,), background=BackgroundTask(ticket.release))
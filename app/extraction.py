@@ -0,0 +1,201 @@
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from app import metrics
+from app.cache import ResultCache, cache_key
+
+# Upload text extraction.
+#
+# Uploads are spooled to a temp file in fixed-size chunks (hashing as we go)
+# instead of being read into memory, and PyMuPDF opens the PDF from disk.
+# Large PDFs are split into page ranges that are extracted in parallel on a
+# process pool; ranges are yielded in order as soon as they are ready.
+# Extracted text is cached by the file's content hash, so re-uploading the
+# same document skips extraction entirely.
+EXTRACT_MAX_BYTES = int(os.getenv("EXTRACT_MAX_BYTES", str(50 * 1024 * 1024)))
+EXTRACT_MAX_PAGES = int(os.getenv("EXTRACT_MAX_PAGES", "1000"))
+EXTRACT_TIMEOUT = float(os.getenv("EXTRACT_TIMEOUT", "60"))
+EXTRACT_PARALLEL_MIN_PAGES = int(os.getenv("EXTRACT_PARALLEL_MIN_PAGES", "32"))
+EXTRACT_PAGES_PER_TASK = int(os.getenv("EXTRACT_PAGES_PER_TASK", "16"))
+EXTRACT_PROCESSES = int(os.getenv("EXTRACT_PROCESSES", str(min(4, os.cpu_count() or 1))))
+
+SPOOL_CHUNK_BYTES = 1024 * 1024
+
+SUPPORTED_TYPES = (".pdf", ".docx")
+
+cache = ResultCache("extraction")
+_process_pool = None
+# Spooled files of extractions in flight: cache key -> [path, holders]. The
+# callers waiting on a key and the extraction itself each hold the file, so
+# the one shared extraction can't lose it to a caller that leaves early.
+_spooled = {}
+
+
+class ExtractionError(ValueError):
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def _get_process_pool():
+    global _process_pool
+    if _process_pool is None:
+        # spawn, not fork: the parent holds torch threads and model weights
+        _process_pool = ProcessPoolExecutor(
+            max_workers=EXTRACT_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+    return _process_pool
+
+
+def shutdown():
+    global _process_pool
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
+
+
+async def spool_upload(upload, max_bytes: int = EXTRACT_MAX_BYTES):
+    # Returns (path, sha256 hex digest); the caller removes the file
+    suffix = os.path.splitext(upload.filename or "")[1].lower()
+    digest = hashlib.sha256()
+    size = 0
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix="upload-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while True:
+                chunk = await upload.read(SPOOL_CHUNK_BYTES)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ExtractionError(f"Upload exceeds the {max_bytes // (1024 * 1024)} MB limit.", status_code=413)
+                digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path, digest.hexdigest()
+
+
+# PyMuPDF and python-docx are imported inside the workers, so they are only
+# loaded once someone uploads a document
+
+def _pdf_page_count(path):
+    import fitz  # PyMuPDF
+
+    with fitz.open(path) as pdf:
+        return pdf.page_count
+
+
+def _extract_pdf_range(path, start, stop):
+    # Runs in a worker process (or thread for small files)
+    import fitz  # PyMuPDF
+
+    with fitz.open(path) as pdf:
+        return "".join(pdf.load_page(i).get_text("text") for i in range(start, stop))
+
+
+def _extract_docx(path):
+    import docx
+
+    return "\n".join(para.text for para in docx.Document(path).paragraphs)
+
+
+async def iter_pdf_text(path: str, max_pages: int = EXTRACT_MAX_PAGES, timeout: float = EXTRACT_TIMEOUT):
+    deadline = time.monotonic() + timeout
+    try:
+        page_count = await asyncio.to_thread(_pdf_page_count, path)
+    except RuntimeError as e:  # fitz raises RuntimeError subclasses for broken files
+        raise ExtractionError(f"Could not open PDF: {e}")
+    if page_count > max_pages:
+        raise ExtractionError(f"PDF has {page_count} pages, the limit is {max_pages}.", status_code=413)
+
+    loop = asyncio.get_running_loop()
+    if page_count < EXTRACT_PARALLEL_MIN_PAGES:
+        futures = [asyncio.ensure_future(asyncio.to_thread(_extract_pdf_range, path, 0, page_count))]
+    else:
+        pool = _get_process_pool()
+        futures = [
+            loop.run_in_executor(pool, _extract_pdf_range, path, start, min(start + EXTRACT_PAGES_PER_TASK, page_count))
+            for start in range(0, page_count, EXTRACT_PAGES_PER_TASK)
+        ]
+
+    try:
+        for future in futures:
+            remaining = deadline - time.monotonic()
+            try:
+                yield await asyncio.wait_for(future, timeout=max(remaining, 0))
+            except asyncio.TimeoutError:
+                raise ExtractionError(f"Text extraction took longer than {timeout:g}s.", status_code=422)
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+async def iter_upload_text(path: str, suffix: str):
+    # Yields the document text piece by piece, in document order
+    if suffix == ".pdf":
+        async for piece in iter_pdf_text(path):
+            yield piece
+    elif suffix == ".docx":
+        try:
+            yield await asyncio.wait_for(asyncio.to_thread(_extract_docx, path), timeout=EXTRACT_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise ExtractionError(f"Text extraction took longer than {EXTRACT_TIMEOUT:g}s.", status_code=422)
+    else:
+        raise ExtractionError("Unsupported file type. Please upload a .docx or .pdf file.")
+
+
+def _hold(key: str, path: str = None):
+    # Returns the spooled file for `key`, registering `path` if there is none;
+    # a duplicate upload of a file already held is removed straight away
+    entry = _spooled.get(key)
+    if entry is None:
+        if path is None:
+            return None
+        entry = _spooled[key] = [path, 0]
+    elif path is not None and path != entry[0]:
+        os.remove(path)
+    entry[1] += 1
+    return entry[0]
+
+
+def _release(key: str):
+    entry = _spooled[key]
+    entry[1] -= 1
+    if not entry[1]:
+        del _spooled[key]
+        os.remove(entry[0])
+
+
+async def extract_upload_text(upload) -> str:
+    suffix = os.path.splitext(upload.filename or "")[1].lower()
+    if suffix not in SUPPORTED_TYPES:
+        raise ExtractionError("Unsupported file type. Please upload a .docx or .pdf file.")
+
+    with metrics.timed("upload"):
+        path, digest = await spool_upload(upload)
+    key = cache_key("extract", suffix, digest, max_pages=EXTRACT_MAX_PAGES)
+    _hold(key, path)
+
+    async def extract():
+        # Runs as the cache's shared task, possibly after this caller left
+        path = _hold(key)
+        if path is None:
+            raise ExtractionError("The upload was abandoned before extraction started.", status_code=499)
+        try:
+            with metrics.timed("extraction"):
+                return "".join([piece async for piece in iter_upload_text(path, suffix)])
+        finally:
+            _release(key)
+
+    try:
+        return await cache.get_or_compute(key, extract)
+    finally:
+        _release(key)
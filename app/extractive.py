@@ -0,0 +1,120 @@
+import os
+import re
+
+# Extractive summarization: TextRank over TF-IDF sentence vectors.
+#
+# Sentences become rows of a sparse TF-IDF matrix X (log-scaled term counts,
+# stop words dropped, rows L2-normalized), so X @ X.T holds their cosine
+# similarities. TextRank is PageRank over that similarity graph. The n x n
+# similarity matrix is never built: each power iteration multiplies by X.T
+# and then X, which costs O(non-zeros) and keeps a 100-page document well
+# under a second.
+#
+# `summarize` picks the best-ranked sentences up to a word budget, in
+# document order. `select` does the same against any per-sentence length,
+# which the summarizer uses to pre-filter long inputs to their most salient
+# sentences before the abstractive model sees them.
+EXTRACTIVE_DAMPING = float(os.getenv("EXTRACTIVE_DAMPING", "0.85"))
+EXTRACTIVE_MAX_ITERATIONS = int(os.getenv("EXTRACTIVE_MAX_ITERATIONS", "100"))
+EXTRACTIVE_TOLERANCE = 1e-6
+
+_word = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+STOP_WORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both but
+by can could did do does doing down during each few for from further had has have having he her here hers herself
+him himself his how i if in into is it its itself just me more most my myself no nor not now of off on once only or
+other our ours ourselves out over own same she should so some such than that the their theirs them themselves then
+there these they this those through to too under until up very was we were what when where which while who whom
+why will with would you your yours yourself yourselves also may might must shall us s t
+""".split())
+
+
+def tfidf_matrix(sentences: list):
+    # Returns a CSR matrix (sentences x terms) with L2-normalized rows
+    import numpy as np
+    from scipy import sparse
+
+    vocabulary = {}
+    rows, cols = [], []
+    for i, sentence in enumerate(sentences):
+        for word in _word.findall(sentence.lower()):
+            if word not in STOP_WORDS:
+                rows.append(i)
+                cols.append(vocabulary.setdefault(word, len(vocabulary)))
+
+    n = len(sentences)
+    counts = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(n, max(len(vocabulary), 1))
+    )
+    counts.sum_duplicates()
+    counts.data = 1 + np.log(counts.data)
+    document_frequency = np.bincount(counts.indices, minlength=counts.shape[1])
+    idf = (np.log((1 + n) / (1 + document_frequency)) + 1).astype(np.float32)
+    matrix = counts.multiply(idf).tocsr()
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
+
+
+def textrank(sentences: list):
+    # Returns one centrality score per sentence (summing to 1)
+    import numpy as np
+
+    n = len(sentences)
+    if n <= 2:
+        return np.full(n, 1 / max(n, 1))
+
+    x = tfidf_matrix(sentences)
+    xt = x.T.tocsr()
+    self_similarity = np.asarray(x.multiply(x).sum(axis=1)).ravel()  # 1, or 0 for empty rows
+
+    def similarity_times(v):
+        # (X X^T - diag) v without forming X X^T
+        return x @ (xt @ v) - self_similarity * v
+
+    degree = similarity_times(np.ones(n))
+    connected = degree > 1e-12
+    inverse_degree = np.zeros(n)
+    inverse_degree[connected] = 1 / degree[connected]
+
+    scores = np.full(n, 1 / n)
+    teleport = (1 - EXTRACTIVE_DAMPING) / n
+    for _ in range(EXTRACTIVE_MAX_ITERATIONS):
+        updated = teleport + EXTRACTIVE_DAMPING * similarity_times(scores * inverse_degree)
+        # Rank held by sentences sharing no words with any other is spread evenly
+        updated += EXTRACTIVE_DAMPING * scores[~connected].sum() / n
+        if np.abs(updated - scores).sum() < EXTRACTIVE_TOLERANCE:
+            scores = updated
+            break
+        scores = updated
+    return scores / scores.sum()
+
+
+def select(scores, lengths: list, budget: int) -> list:
+    # Indices of the best-scored sentences whose lengths fit in `budget`,
+    # in document order; always at least the best one
+    import numpy as np
+
+    chosen = []
+    used = 0
+    for i in np.argsort(-np.asarray(scores), kind="stable"):
+        if chosen and used + lengths[i] > budget:
+            continue
+        chosen.append(int(i))
+        used += lengths[i]
+        if used >= budget:
+            break
+    return sorted(chosen)
+
+
+def summarize(sentences: list, max_words: int) -> dict:
+    if not sentences:
+        return {"summary": "", "sentences": 0, "selected": 0}
+    scores = textrank(sentences)
+    chosen = select(scores, [len(sentence.split()) for sentence in sentences], max_words)
+    return {
+        "summary": " ".join(sentences[i] for i in chosen),
+        "sentences": len(sentences),
+        "selected": len(chosen),
+    }
@@ -0,0 +1,235 @@
+import asyncio
+import email.utils
+import json
+import os
+import random
+import time
+
+import httpx
+from dotenv import load_dotenv
+
+from app import metrics, stats
+from app.cache import ResultCache, cache_key
+
+# Load environment variables from the .env file
+load_dotenv()
+
+# Shared async client for the Groq chat completions API.
+#
+# One keep-alive connection pool is reused by every Groq-backed route, a
+# semaphore bounds how many calls are in flight upstream at once, and 429/5xx
+# responses are retried with jittered exponential backoff (honouring
+# Retry-After). Point GROQ_BASE_URL at a local stub server to test without
+# the network.
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1")
+GROQ_MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "16"))
+GROQ_TIMEOUT = float(os.getenv("GROQ_TIMEOUT", "60"))
+GROQ_CONNECT_TIMEOUT = float(os.getenv("GROQ_CONNECT_TIMEOUT", "5"))
+GROQ_MAX_RETRIES = int(os.getenv("GROQ_MAX_RETRIES", "3"))
+GROQ_BACKOFF_BASE = float(os.getenv("GROQ_BACKOFF_BASE", "0.5"))
+GROQ_BACKOFF_MAX = float(os.getenv("GROQ_BACKOFF_MAX", "20"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    pass
+
+
+def _retry_after(response):
+    # Retry-After is either a number of seconds or an HTTP date
+    value = response.headers.get("Retry-After") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class GroqClient:
+    def __init__(
+        self,
+        base_url: str = GROQ_BASE_URL,
+        api_key: str = None,
+        max_concurrency: int = GROQ_MAX_CONCURRENCY,
+        timeout: float = GROQ_TIMEOUT,
+        connect_timeout: float = GROQ_CONNECT_TIMEOUT,
+        max_retries: int = GROQ_MAX_RETRIES,
+        backoff_base: float = GROQ_BACKOFF_BASE,
+        backoff_max: float = GROQ_BACKOFF_MAX,
+        transport: httpx.AsyncBaseTransport = None,
+    ):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.transport = transport
+
+        self._client = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._inflight = 0
+        self._requests = 0
+        self._retries = 0
+        self._failures = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the running event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={
+                    "Authorization": f"Bearer {self.api_key or os.getenv('GROQ_API_KEY')}",
+                    "Content-Type": "application/json",
+                },
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrency,
+                    max_keepalive_connections=self.max_concurrency,
+                ),
+                transport=self.transport,
+            )
+        return self._client
+
+    def _backoff(self, attempt: int, response=None) -> float:
+        # Full jitter, but never retry earlier than the server asked us to
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = _retry_after(response)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    async def post(self, path: str, payload: dict) -> dict:
+        self._requests += 1
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                async with self._semaphore:
+                    self._inflight += 1
+                    try:
+                        with metrics.timed("upstream", model=payload.get("model", "")):
+                            response = await self.client.post(path, json=payload)
+                    finally:
+                        self._inflight -= 1
+                if response.status_code not in RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response.json()
+                error = UpstreamError(f"{response.status_code} from upstream: {response.text[:200]}")
+            except httpx.HTTPStatusError as e:
+                self._failures += 1
+                metrics.count_error("upstream")
+                raise UpstreamError(f"{e.response.status_code} from upstream: {e.response.text[:200]}") from e
+            except httpx.TransportError as e:
+                error = UpstreamError(f"{type(e).__name__}: {e}")
+
+            if attempt == self.max_retries:
+                break
+            self._retries += 1
+            await asyncio.sleep(self._backoff(attempt, response))
+
+        self._failures += 1
+        metrics.count_error("upstream")
+        raise error
+
+    async def chat_completion(self, messages: list, max_tokens: int = 4096, model: str = GROQ_MODEL, **params) -> str:
+        data = {"model": model, "messages": messages, "max_tokens": max_tokens, **params}
+        completion = await self.post("/chat/completions", data)
+        usage = completion.get("usage") if isinstance(completion, dict) else None
+        if usage:
+            metrics.count_tokens(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), model=model)
+        try:
+            return completion["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError) as e:
+            raise UpstreamError(f"Unexpected response from upstream: {completion!r:.200}") from e
+
+    async def stream_chat_completion(self, messages: list, max_tokens: int = 4096, model: str = GROQ_MODEL, **params):
+        # Yields content deltas as they arrive. Retries only happen before the
+        # first token; closing the generator early (client went away) closes
+        # the upstream connection so the completion is abandoned right away.
+        data = {"model": model, "messages": messages, "max_tokens": max_tokens, "stream": True, **params}
+        self._requests += 1
+        started = False
+        requested_at = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            retry_response = None
+            try:
+                async with self._semaphore:
+                    self._inflight += 1
+                    try:
+                        async with self.client.stream("POST", "/chat/completions", json=data) as response:
+                            if response.status_code in RETRY_STATUSES and attempt < self.max_retries:
+                                retry_response = response
+                            elif response.status_code >= 400:
+                                body = (await response.aread()).decode(errors="replace")
+                                self._failures += 1
+                                metrics.count_error("upstream")
+                                raise UpstreamError(f"{response.status_code} from upstream: {body[:200]}")
+                            else:
+                                async for line in response.aiter_lines():
+                                    if not line.startswith("data:"):
+                                        continue
+                                    payload = line[5:].strip()
+                                    if payload == "[DONE]":
+                                        return
+                                    delta = json.loads(payload)["choices"][0].get("delta", {}).get("content")
+                                    if delta:
+                                        if not started:
+                                            started = True
+                                            metrics.observe(
+                                                "upstream_first_token", time.perf_counter() - requested_at, model=model
+                                            )
+                                        yield delta
+                                return
+                    finally:
+                        self._inflight -= 1
+            except httpx.TransportError as e:
+                if started or attempt == self.max_retries:
+                    self._failures += 1
+                    metrics.count_error("upstream")
+                    raise UpstreamError(f"{type(e).__name__}: {e}") from e
+
+            self._retries += 1
+            await asyncio.sleep(self._backoff(attempt, retry_response))
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def snapshot(self):
+        return {
+            "base_url": self.base_url,
+            "max_concurrency": self.max_concurrency,
+            "inflight": self._inflight,
+            "requests": self._requests,
+            "retries": self._retries,
+            "failures": self._failures,
+        }
+
+
+# Shared instance used by every Groq-backed route
+client = GroqClient()
+stats.register("groq", client.snapshot)
+cache = ResultCache("groq")
+
+
+async def chat_completion(messages: list, max_tokens: int = 4096, **params) -> str:
+    key = cache_key("chat_completion", params.get("model", GROQ_MODEL), json.dumps(messages), max_tokens=max_tokens, **params)
+    return await cache.get_or_compute(key, lambda: client.chat_completion(messages, max_tokens=max_tokens, **params))
+
+
+def stream_chat_completion(messages: list, max_tokens: int = 4096, **params):
+    return client.stream_chat_completion(messages, max_tokens=max_tokens, **params)
+
+
+async def aclose():
+    await client.aclose()
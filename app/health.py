@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import os
+import time
+
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app import stats
+from app.batching import schedulers
+from app.languagetool_pool import pool as languagetool_pool
+from app.model_registry import MODEL_PRELOAD, registry
+from app.resources import check_nltk
+
+logger = logging.getLogger(__name__)
+
+# Liveness and readiness.
+#
+# The process starts serving straight away; models are loaded and warmed in
+# the background. Warming a model means running one tiny generate through its
+# batch scheduler, so the first real request doesn't pay for lazy kernel and
+# allocator setup. /healthz only says the process is up; /readyz returns 503
+# until every subsystem being warmed is ready, with per-subsystem detail, so
+# an orchestrator can hold traffic until then.
+#
+# WARMUP_MODELS defaults to MODEL_PRELOAD ("all" for every registered model,
+# "languagetool" for the LanguageTool pool); models not listed still load
+# lazily on first use and don't affect readiness.
+WARMUP_MODELS = [
+    name.strip() for name in os.getenv("WARMUP_MODELS", ",".join(MODEL_PRELOAD)).split(",") if name.strip()
+]
+WARMUP_TEXT = "This is a short warm-up sentence."
+
+router = APIRouter()
+
+
+class Subsystem:
+    def __init__(self, name: str):
+        self.name = name
+        self.state = "pending"
+        self.seconds = None
+        self.error = None
+
+    def snapshot(self):
+        return {"state": self.state, "seconds": self.seconds, "error": self.error}
+
+
+subsystems = {}
+
+
+async def _warm(name: str, warm):
+    subsystem = subsystems.setdefault(name, Subsystem(name))
+    subsystem.state = "warming"
+    started = time.perf_counter()
+    try:
+        await warm()
+    except Exception as e:
+        subsystem.state = "failed"
+        subsystem.error = f"{type(e).__name__}: {e}"
+        logger.error("warm-up of %s failed: %s", name, subsystem.error)
+    else:
+        subsystem.state = "ready"
+        subsystem.error = None
+    subsystem.seconds = round(time.perf_counter() - started, 2)
+
+
+async def _warm_model(name: str):
+    async with registry.use(name):
+        pass
+    scheduler = schedulers.get(name)
+    if scheduler is not None:
+        await scheduler.submit(WARMUP_TEXT, max_input_length=64, max_length=16, num_beams=1)
+
+
+def _warmup_targets(names=None):
+    names = names if names is not None else WARMUP_MODELS
+    if "all" in names:
+        names = list(schedulers) + ["languagetool"]
+    return [name for name in names if name in schedulers or name == "languagetool"]
+
+
+def start_warm_up(names=None):
+    # Marks every target pending right away, so /readyz can't report ready
+    # before the background warm-up has even started
+    targets = ["nltk"] + _warmup_targets(names)
+    for name in targets:
+        subsystems.setdefault(name, Subsystem(name))
+
+    async def nltk():
+        await asyncio.to_thread(check_nltk)
+
+    jobs = []
+    for name in targets:
+        if name == "nltk":
+            jobs.append(_warm(name, nltk))
+        elif name == "languagetool":
+            jobs.append(_warm(name, languagetool_pool.start))
+        else:
+            jobs.append(_warm(name, lambda name=name: _warm_model(name)))
+    return asyncio.ensure_future(asyncio.gather(*jobs))
+
+
+def snapshot():
+    return {name: subsystem.snapshot() for name, subsystem in subsystems.items()}
+
+
+stats.register("readiness", snapshot)
+
+
+@router.get("/healthz")
+async def healthz():
+    return {"status": "ok"}
+
+
+@router.get("/readyz")
+async def readyz():
+    ready = all(subsystem.state == "ready" for subsystem in subsystems.values())
+    body = {"ready": ready, "subsystems": snapshot()}
+    return JSONResponse(body, status_code=200 if ready else 503)
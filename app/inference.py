@@ -0,0 +1,44 @@
+import asyncio
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# Transformer inference (tokenize / generate / decode) is blocking and CPU
+# heavy, so it must never run on the event loop. Each model gets its own
+# thread pool; torch releases the GIL inside its kernels, so the threads run
+# truly in parallel while the loop keeps serving other routes.
+#
+# Pool size is configurable per model, e.g. INFERENCE_WORKERS_SUMMARIZER=2,
+# falling back to INFERENCE_WORKERS (default 1).
+DEFAULT_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+
+_executors = {}
+
+
+def pool_size(name: str) -> int:
+    env_key = "INFERENCE_WORKERS_" + re.sub(r"[^A-Z0-9]", "_", name.upper())
+    return max(1, int(os.getenv(env_key, DEFAULT_WORKERS)))
+
+
+def get_executor(name: str) -> ThreadPoolExecutor:
+    executor = _executors.get(name)
+    if executor is None:
+        executor = ThreadPoolExecutor(
+            max_workers=pool_size(name),
+            thread_name_prefix=f"inference-{name}",
+        )
+        _executors[name] = executor
+    return executor
+
+
+async def run_inference(name: str, fn, *args, **kwargs):
+    # Run fn(*args, **kwargs) on the named model's pool and await the result
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(name), partial(fn, *args, **kwargs))
+
+
+def shutdown():
+    for executor in _executors.values():
+        executor.shutdown(wait=False, cancel_futures=True)
+    _executors.clear()
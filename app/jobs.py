@@ -0,0 +1,564 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from app import stats
+from app.streaming import ndjson_response
+
+logger = logging.getLogger(__name__)
+
+# Asynchronous bulk jobs backed by a local SQLite queue.
+#
+# A job is a list of items (texts to summarize, or papers to review) stored
+# in JOBS_DB along with its parameters; submitting returns a job id straight
+# away. Worker processes (python -m app.jobs worker, or JOBS_WORKERS started
+# with the API) claim pending items in chunks of the same kind, across jobs,
+# so the batch scheduler can pad them into shared generate calls. Each result
+# is written as soon as its item finishes.
+#
+# Claims are leases: a worker keeps extending them while it works, and items
+# whose lease ran out (the worker died, or the whole server restarted) go back
+# to pending. Finished items are never recomputed, so a restart resumes a job
+# where it stopped. An item that fails JOBS_MAX_ATTEMPTS times is marked
+# failed and the rest of the job carries on.
+#
+# Clients poll GET /jobs/{id} and /jobs/{id}/results, or follow
+# /jobs/{id}/stream (NDJSON) for per-item results as they complete.
+JOBS_DB = os.getenv("JOBS_DB", os.path.join(os.path.expanduser("~"), ".cache", "textcraft", "jobs.sqlite3"))
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "1"))
+JOBS_CLAIM_SIZE = int(os.getenv("JOBS_CLAIM_SIZE", "16"))
+JOBS_LEASE_SECONDS = float(os.getenv("JOBS_LEASE_SECONDS", "120"))
+JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", "1"))
+JOBS_MAX_ITEMS = int(os.getenv("JOBS_MAX_ITEMS", "1000"))
+JOBS_MAX_ATTEMPTS = int(os.getenv("JOBS_MAX_ATTEMPTS", "3"))
+
+KINDS = ("summarize", "literature_review")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    cancelled INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    job_id TEXT NOT NULL,
+    idx INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    input TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    result TEXT,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    lease_until REAL,
+    seq INTEGER,
+    created REAL NOT NULL,
+    PRIMARY KEY (job_id, idx)
+);
+CREATE INDEX IF NOT EXISTS items_claim ON items (status, kind, created);
+CREATE INDEX IF NOT EXISTS items_seq ON items (job_id, seq);
+"""
+
+
+class JobStore:
+    # One connection shared by threads behind a lock; WAL lets the API and
+    # the worker processes read and write the same file concurrently
+    def __init__(self, path: str = JOBS_DB):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def _transaction(self, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def create(self, kind: str, inputs: list, params: dict) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+
+        def insert(conn):
+            conn.execute(
+                "INSERT INTO jobs (id, kind, params, total, created) VALUES (?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(params), len(inputs), now),
+            )
+            conn.executemany(
+                "INSERT INTO items (job_id, idx, kind, input, created) VALUES (?, ?, ?, ?, ?)",
+                [(job_id, i, kind, json.dumps(item), now) for i, item in enumerate(inputs)],
+            )
+
+        self._transaction(insert)
+        return job_id
+
+    def claim(self, worker: str, limit: int = JOBS_CLAIM_SIZE) -> list:
+        # Oldest claimable item decides the kind; then up to `limit` items of
+        # that kind across jobs. Expired leases count as claimable.
+        now = time.time()
+
+        def claim(conn):
+            claimable = "(status = 'pending' OR (status = 'running' AND lease_until < ?))"
+            first = conn.execute(
+                f"SELECT kind FROM items WHERE {claimable} ORDER BY created, idx LIMIT 1", (now,)
+            ).fetchone()
+            if first is None:
+                return []
+            rows = conn.execute(
+                f"SELECT i.job_id, i.idx, i.input, i.attempts, j.params FROM items i JOIN jobs j ON j.id = i.job_id "
+                f"WHERE {claimable} AND i.kind = ? ORDER BY i.created, i.idx LIMIT ?",
+                (now, first["kind"], limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE items SET status = 'running', worker = ?, lease_until = ?, attempts = attempts + 1 "
+                "WHERE job_id = ? AND idx = ?",
+                [(worker, now + JOBS_LEASE_SECONDS, row["job_id"], row["idx"]) for row in rows],
+            )
+            return [
+                {
+                    "job_id": row["job_id"],
+                    "idx": row["idx"],
+                    "kind": first["kind"],
+                    "input": json.loads(row["input"]),
+                    "params": json.loads(row["params"]),
+                    "attempt": row["attempts"] + 1,
+                }
+                for row in rows
+            ]
+
+        return self._transaction(claim)
+
+    def extend(self, worker: str, items: list):
+        until = time.time() + JOBS_LEASE_SECONDS
+        self._transaction(lambda conn: conn.executemany(
+            "UPDATE items SET lease_until = ? WHERE job_id = ? AND idx = ? AND worker = ? AND status = 'running'",
+            [(until, item["job_id"], item["idx"], worker) for item in items],
+        ))
+
+    def finish(self, worker: str, item: dict, result=None, error: str = None):
+        # A failed attempt goes back to pending until it runs out of attempts
+        if error is None:
+            status = "done"
+        elif item["attempt"] >= JOBS_MAX_ATTEMPTS:
+            status = "failed"
+        else:
+            status = "pending"
+
+        def finish(conn):
+            seq = None
+            if status != "pending":
+                seq = conn.execute(
+                    "SELECT COALESCE(MAX(seq), 0) + 1 FROM items WHERE job_id = ?", (item["job_id"],)
+                ).fetchone()[0]
+            conn.execute(
+                "UPDATE items SET status = ?, result = ?, error = ?, seq = ?, lease_until = NULL "
+                "WHERE job_id = ? AND idx = ? AND worker = ? AND status = 'running'",
+                (status, None if result is None else json.dumps(result), error, seq, item["job_id"], item["idx"], worker),
+            )
+
+        self._transaction(finish)
+
+    def release(self, worker: str):
+        # A worker shutting down hands its unfinished items straight back
+        # instead of leaving them to wait out their leases
+        self._transaction(lambda conn: conn.execute(
+            "UPDATE items SET status = 'pending', worker = NULL, lease_until = NULL, attempts = attempts - 1 "
+            "WHERE worker = ? AND status = 'running'",
+            (worker,),
+        ))
+
+    def cancel(self, job_id: str) -> bool:
+        def cancel(conn):
+            found = conn.execute("UPDATE jobs SET cancelled = 1 WHERE id = ?", (job_id,)).rowcount
+            conn.execute("UPDATE items SET status = 'cancelled' WHERE job_id = ? AND status = 'pending'", (job_id,))
+            return bool(found)
+
+        return self._transaction(cancel)
+
+    def status(self, job_id: str) -> Optional[dict]:
+        jobs = self._query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        if not jobs:
+            return None
+        job = jobs[0]
+        counts = {status: 0 for status in ("pending", "running", "done", "failed", "cancelled")}
+        for row in self._query("SELECT status, COUNT(*) AS n FROM items WHERE job_id = ? GROUP BY status", (job_id,)):
+            counts[row["status"]] = row["n"]
+        finished = counts["pending"] == 0 and counts["running"] == 0
+        return {
+            "job_id": job["id"],
+            "kind": job["kind"],
+            "params": json.loads(job["params"]),
+            "total": job["total"],
+            "counts": counts,
+            "status": "cancelled" if job["cancelled"] else "finished" if finished else "running",
+            "created": job["created"],
+        }
+
+    def results(self, job_id: str, after: int = 0, limit: int = 100) -> list:
+        # Finished items in completion order; `after` is the last seq seen
+        rows = self._query(
+            "SELECT idx, status, result, error, seq FROM items WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+            (job_id, after, limit),
+        )
+        return [
+            {
+                "index": row["idx"],
+                "status": row["status"],
+                "result": json.loads(row["result"]) if row["result"] is not None else None,
+                "error": row["error"],
+                "seq": row["seq"],
+            }
+            for row in rows
+        ]
+
+    def snapshot(self):
+        counts = {row["status"]: row["n"] for row in self._query("SELECT status, COUNT(*) AS n FROM items GROUP BY status")}
+        jobs = self._query("SELECT COUNT(*) AS n FROM jobs")[0]["n"]
+        return {"db": self.path, "jobs": jobs, "items": counts, "local_workers": local_workers()}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_store = None
+
+
+def get_store() -> JobStore:
+    global _store
+    if _store is None:
+        _store = JobStore()
+    return _store
+
+
+stats.register("jobs", lambda: get_store().snapshot())
+
+
+# Workers
+
+async def _run_summarize(store, worker, items):
+    from app.cache import cache_key
+    from app.quality import resolve as resolve_quality
+    from app.summarizer import cache, model_name, scheduler, summarize_document
+
+    async def run(item):
+        text, length, long_document = item["input"], item["params"]["length"], item["params"]["long_document"]
+        tier = resolve_quality(item["params"].get("quality"), scheduler)
+        # Same key as /summarizer/summarize, so either one reuses the other's work
+        key = cache_key("summarize", model_name, text, length=length, long_document=long_document, quality=tier)
+        try:
+            result = await cache.get_or_compute(key, lambda: summarize_document(text, length, long_document, tier))
+        except Exception as e:
+            await asyncio.to_thread(store.finish, worker, item, error=f"{type(e).__name__}: {e}")
+        else:
+            await asyncio.to_thread(store.finish, worker, item, result=result)
+
+    # Concurrent, so the summarizer's batch scheduler pads them together
+    await asyncio.gather(*(run(item) for item in items))
+
+
+async def _run_literature_review(store, worker, items):
+    # A claim can span jobs asking for different tiers
+    groups = {}
+    for item in items:
+        groups.setdefault(item["params"].get("quality"), []).append(item)
+    await asyncio.gather(*(_review_papers(store, worker, group, quality) for quality, group in groups.items()))
+
+
+async def _review_papers(store, worker, items, quality):
+    from app.literature_review import scheduler, summarize_in_batches, to_summarized_paper
+    from app.quality import resolve as resolve_quality
+    from fastapi.encoders import jsonable_encoder
+
+    tier = resolve_quality(quality, scheduler)
+    done = set()
+    try:
+        async for indices, summaries, _ in summarize_in_batches([item["input"]["abstract"] for item in items], tier):
+            for i, summary in zip(indices, summaries):
+                paper = jsonable_encoder(to_summarized_paper(items[i]["input"], summary))
+                await asyncio.to_thread(store.finish, worker, items[i], result={**paper, "quality": tier})
+                done.add(i)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        for i, item in enumerate(items):
+            if i not in done:
+                await asyncio.to_thread(store.finish, worker, item, error=error)
+
+
+RUNNERS = {"summarize": _run_summarize, "literature_review": _run_literature_review}
+
+
+async def _keep_leases(store, worker, items):
+    while True:
+        await asyncio.sleep(JOBS_LEASE_SECONDS / 3)
+        try:
+            await asyncio.to_thread(store.extend, worker, items)
+        except Exception:
+            logger.exception("job worker %s could not extend its leases", worker)
+
+
+async def _fail_claim(store, worker, items, error):
+    # Items the runner left unfinished count as one failed attempt; finish
+    # leaves the ones it already wrote alone
+    for item in items:
+        try:
+            await asyncio.to_thread(store.finish, worker, item, error=error)
+        except Exception:
+            logger.exception("job worker %s could not hand back item %d of job %s", worker, item["idx"], item["job_id"])
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+async def run_worker(store: JobStore = None, worker: str = None, once: bool = False):
+    store = store or get_store()
+    worker = worker or worker_id()
+    logger.info("job worker %s polling %s", worker, store.path)
+    while True:
+        try:
+            items = await asyncio.to_thread(store.claim, worker)
+        except Exception:
+            logger.exception("job worker %s could not claim items", worker)
+            items = []
+        if not items:
+            if once:
+                return
+            await asyncio.sleep(JOBS_POLL_INTERVAL)
+            continue
+        leases = asyncio.ensure_future(_keep_leases(store, worker, items))
+        try:
+            await RUNNERS[items[0]["kind"]](store, worker, items)
+        except Exception as e:
+            # One bad claim doesn't end the worker
+            logger.exception("job worker %s failed on %d %s items", worker, len(items), items[0]["kind"])
+            await _fail_claim(store, worker, items, f"{type(e).__name__}: {e}")
+        finally:
+            leases.cancel()
+
+
+def _exit(signum, frame):
+    raise SystemExit(0)
+
+
+def worker_main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(process)d %(name)s %(message)s")
+    signal.signal(signal.SIGTERM, _exit)
+    worker = worker_id()
+    try:
+        asyncio.run(run_worker(worker=worker))
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        get_store().release(worker)
+
+
+_processes = []
+_owner = None
+
+
+def _start_process():
+    # spawn, not fork: the API process may already hold model threads
+    process = multiprocessing.get_context("spawn").Process(target=worker_main, name="textcraft-job-worker", daemon=True)
+    process.start()
+    return process
+
+
+def start_workers(count: int = None):
+    # A process forked from the one that started the workers (the API
+    # workers of app.serve) leaves them to it rather than starting its own
+    global _owner
+    if _owner is not None and _owner != os.getpid():
+        return
+    count = JOBS_WORKERS if count is None else count
+    if count <= 0:
+        return
+    for _ in range(count):
+        _processes.append(_start_process())
+    _owner = os.getpid()
+
+
+def local_workers() -> int:
+    # Forked API workers inherit the list but do not own the processes
+    if _owner != os.getpid():
+        return 0
+    return sum(process.is_alive() for process in _processes)
+
+
+def restart_dead_workers() -> int:
+    # Replaces job workers that exited on their own; returns how many
+    if _owner != os.getpid():
+        return 0
+    restarted = 0
+    for i, process in enumerate(_processes):
+        if not process.is_alive():
+            logger.warning("job worker %d exited with code %s, restarting", process.pid, process.exitcode)
+            _processes[i] = _start_process()
+            restarted += 1
+    return restarted
+
+
+def stop_workers():
+    # Forked API workers inherit the list but do not own the processes
+    if _owner != os.getpid():
+        return
+    for process in _processes:
+        process.terminate()
+    for process in _processes:
+        process.join(timeout=10)
+    _processes.clear()
+
+
+# API
+
+router = APIRouter()
+
+
+class SummarizeJobRequest(BaseModel):
+    texts: List[str]
+    length: int = 150
+    long_document: bool = True
+    quality: Optional[str] = None  # "auto" is resolved when a worker runs the item
+
+
+class LiteratureReviewJobRequest(BaseModel):
+    topic: str
+    papers: list  # same paper dicts as /lit/api/fetch-summarized-papers
+    quality: Optional[str] = None
+
+
+def _check_quality(requested):
+    from app.quality import MODES
+
+    if requested is not None and requested.lower() not in MODES:
+        raise HTTPException(status_code=400, detail="quality must be one of fast, balanced, best or auto")
+
+
+def _check_size(n):
+    if n == 0:
+        raise HTTPException(status_code=400, detail="A job needs at least one item")
+    if n > JOBS_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {JOBS_MAX_ITEMS} items per job")
+
+
+@router.post("/summarize")
+async def submit_summarize_job(request: SummarizeJobRequest):
+    _check_size(len(request.texts))
+    _check_quality(request.quality)
+    params = {"length": request.length, "long_document": request.long_document, "quality": request.quality}
+    job_id = await asyncio.to_thread(get_store().create, "summarize", request.texts, params)
+    return JSONResponse({"job_id": job_id, "items": len(request.texts)}, status_code=202)
+
+
+@router.post("/literature-review")
+async def submit_literature_review_job(request: LiteratureReviewJobRequest):
+    from app.literature_review import validate_papers
+
+    _check_size(len(request.papers))
+    validate_papers(request.papers)
+    _check_quality(request.quality)
+    params = {"topic": request.topic, "quality": request.quality}
+    job_id = await asyncio.to_thread(get_store().create, "literature_review", request.papers, params)
+    return JSONResponse({"job_id": job_id, "items": len(request.papers)}, status_code=202)
+
+
+async def _status_or_404(job_id):
+    status = await asyncio.to_thread(get_store().status, job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="No such job")
+    return status
+
+
+@router.get("/{job_id}")
+async def get_job(job_id: str):
+    return await _status_or_404(job_id)
+
+
+@router.get("/{job_id}/results")
+async def get_job_results(job_id: str, after: int = 0, limit: int = 100):
+    # Page through finished items: pass the last `seq` you saw as `after`
+    await _status_or_404(job_id)
+    results = await asyncio.to_thread(get_store().results, job_id, after, min(max(limit, 1), 1000))
+    return {"results": results, "next": results[-1]["seq"] if results else after}
+
+
+@router.get("/{job_id}/stream")
+async def stream_job(job_id: str, after: int = 0):
+    # NDJSON: one {"type": "item"} record per finished item, in completion
+    # order, then {"type": "done"} with the final status
+    await _status_or_404(job_id)
+    store = get_store()
+
+    async def records():
+        cursor = after
+        while True:
+            results = await asyncio.to_thread(store.results, job_id, cursor, 100)
+            for result in results:
+                cursor = result["seq"]
+                yield {"type": "item", **result}
+            if results:
+                continue
+            status = await asyncio.to_thread(store.status, job_id)
+            if status["status"] != "running":
+                yield {"type": "done", **status}
+                return
+            await asyncio.sleep(JOBS_POLL_INTERVAL)
+
+    return ndjson_response(records())
+
+
+@router.delete("/{job_id}")
+async def cancel_job(job_id: str):
+    if not await asyncio.to_thread(get_store().cancel, job_id):
+        raise HTTPException(status_code=404, detail="No such job")
+    return await _status_or_404(job_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk job workers")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("worker", help="run a job worker in the foreground")
+    status_parser = subparsers.add_parser("status", help="print a job's status")
+    status_parser.add_argument("job_id")
+    args = parser.parse_args()
+
+    if args.command == "worker":
+        worker_main()
+    else:
+        print(json.dumps(get_store().status(args.job_id), indent=2))
+
+
+if __name__ == "__main__":
+    main()
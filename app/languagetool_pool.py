@@ -0,0 +1,206 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app import metrics, stats
+
+# Pool of local LanguageTool servers.
+#
+# Each instance is its own JVM (language_tool_python starts a local server on
+# a free port), so checks no longer serialize behind a single backend.
+# Requests go to the healthy instance with the fewest checks in flight, ties
+# broken by recent latency. A background task health-checks every instance
+# and restarts any whose JVM died or stopped answering. Everything runs
+# locally; set LTP_PATH to a pre-downloaded LanguageTool so the first start
+# doesn't need the network.
+LANGUAGETOOL_LANGUAGE = os.getenv("LANGUAGETOOL_LANGUAGE", "en-US")
+LANGUAGETOOL_INSTANCES = int(os.getenv("LANGUAGETOOL_INSTANCES", "2"))
+LANGUAGETOOL_CONCURRENCY_PER_INSTANCE = int(os.getenv("LANGUAGETOOL_CONCURRENCY_PER_INSTANCE", "4"))
+LANGUAGETOOL_HEALTH_INTERVAL = float(os.getenv("LANGUAGETOOL_HEALTH_INTERVAL", "15"))
+LANGUAGETOOL_HEALTH_TIMEOUT = float(os.getenv("LANGUAGETOOL_HEALTH_TIMEOUT", "10"))
+
+WARMUP_TEXT = "This is a warm-up sentence with a speling mistake."
+EWMA_ALPHA = 0.2
+
+
+class _Instance:
+    def __init__(self, index: int):
+        self.index = index
+        self.tool = None
+        self.healthy = False
+        self.inflight = 0
+        self.checks = 0
+        self.failures = 0
+        self.restarts = 0
+        self.latency_ewma = 0.0
+        self.restarting = None
+
+    def alive(self) -> bool:
+        # language_tool_python keeps the JVM handle in a private attribute
+        server = getattr(self.tool, "_server", None)
+        return self.tool is not None and (server is None or server.poll() is None)
+
+    def snapshot(self):
+        return {
+            "healthy": self.healthy,
+            "inflight": self.inflight,
+            "checks": self.checks,
+            "failures": self.failures,
+            "restarts": self.restarts,
+            "latency_ms": round(self.latency_ewma * 1000, 2),
+        }
+
+
+class LanguageToolPool:
+    def __init__(self, size: int = LANGUAGETOOL_INSTANCES, language: str = LANGUAGETOOL_LANGUAGE):
+        self.language = language
+        self.instances = [_Instance(i) for i in range(max(1, size))]
+        self._executor = ThreadPoolExecutor(
+            max_workers=len(self.instances) * LANGUAGETOOL_CONCURRENCY_PER_INSTANCE + len(self.instances),
+            thread_name_prefix="languagetool",
+        )
+        self._started = None
+        self._health_task = None
+
+    async def _run(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _start_instance(self, instance):
+        # Blocking: launches the JVM and runs one check so it is warm
+        if instance.tool is not None:
+            try:
+                instance.tool.close()
+            except Exception:
+                pass
+        import language_tool_python
+
+        instance.tool = language_tool_python.LanguageTool(self.language)
+        instance.tool.check(WARMUP_TEXT)
+
+    async def _restart(self, instance, count=True):
+        # Concurrent callers share one restart
+        if instance.restarting is None:
+            instance.healthy = False
+
+            async def restart():
+                try:
+                    await self._run(self._start_instance, instance)
+                    instance.healthy = True
+                    if count:
+                        instance.restarts += 1
+                finally:
+                    instance.restarting = None
+
+            instance.restarting = asyncio.ensure_future(restart())
+        await asyncio.shield(instance.restarting)
+
+    def _restart_in_background(self, instance):
+        task = asyncio.ensure_future(self._restart(instance))
+        # A failed restart is retried by the health checker
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def start(self):
+        # Idempotent: starts and warms every instance, then the health checker
+        if self._started is None:
+            async def start_all():
+                results = await asyncio.gather(
+                    *(self._restart(instance, count=False) for instance in self.instances), return_exceptions=True
+                )
+                if not any(instance.healthy for instance in self.instances):
+                    raise RuntimeError(f"No LanguageTool instance could be started: {results[0]!r}")
+                self._health_task = asyncio.ensure_future(self._health_loop())
+
+            self._started = asyncio.ensure_future(start_all())
+        try:
+            await asyncio.shield(self._started)
+        except Exception:
+            self._started = None
+            raise
+
+    def _pick(self):
+        healthy = [instance for instance in self.instances if instance.healthy]
+        if not healthy:
+            return None
+        return min(healthy, key=lambda instance: (instance.inflight, instance.latency_ewma))
+
+    async def check(self, text: str):
+        await self.start()
+        last_error = None
+        for _ in range(2):
+            instance = self._pick()
+            if instance is None:
+                # Everything is restarting; wait for the first one back
+                restarting = [instance.restarting for instance in self.instances if instance.restarting]
+                if not restarting:
+                    break
+                await asyncio.wait(restarting, return_when=asyncio.FIRST_COMPLETED)
+                continue
+
+            instance.inflight += 1
+            started = time.perf_counter()
+            try:
+                matches = await self._run(instance.tool.check, text)
+            except Exception as e:
+                instance.failures += 1
+                last_error = e
+                if not instance.alive():
+                    self._restart_in_background(instance)
+                continue
+            finally:
+                instance.inflight -= 1
+
+            elapsed = time.perf_counter() - started
+            metrics.observe("languagetool", elapsed, model=self.language)
+            instance.checks += 1
+            if instance.checks == 1:
+                instance.latency_ewma = elapsed
+            else:
+                instance.latency_ewma += EWMA_ALPHA * (elapsed - instance.latency_ewma)
+            return matches
+        metrics.count_error("languagetool")
+        raise RuntimeError(f"LanguageTool check failed: {last_error}")
+
+    async def _health_check(self, instance):
+        if instance.restarting is not None:
+            return
+        try:
+            if not instance.alive():
+                raise RuntimeError("JVM exited")
+            await asyncio.wait_for(self._run(instance.tool.check, "ping"), timeout=LANGUAGETOOL_HEALTH_TIMEOUT)
+            instance.healthy = True
+        except Exception:
+            try:
+                await self._restart(instance)
+            except Exception:
+                # Try again on the next round
+                instance.healthy = False
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(LANGUAGETOOL_HEALTH_INTERVAL)
+            await asyncio.gather(*(self._health_check(instance) for instance in self.instances))
+
+    def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+        for instance in self.instances:
+            if instance.tool is not None:
+                try:
+                    instance.tool.close()
+                except Exception:
+                    pass
+                instance.tool = None
+                instance.healthy = False
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def snapshot(self):
+        return {
+            "language": self.language,
+            "instances": [instance.snapshot() for instance in self.instances],
+            "queue_depth": sum(instance.inflight for instance in self.instances),
+        }
+
+
+pool = LanguageToolPool()
+stats.register("languagetool", pool.snapshot)
@@ -1,40 +1,46 @@
-from fastapi import FastAPI, HTTPException, APIRouter
+from fastapi import Depends, HTTPException, APIRouter
 from pydantic import BaseModel
-from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from typing import Optional
+from fastapi.responses import StreamingResponse
+from fastapi.encoders import jsonable_encoder
+from starlette.background import BackgroundTask
 import os
-from docx import Document
-from docx.shared import Pt
-from docx.oxml.ns import nsdecls
-from docx.oxml import parse_xml
+from urllib.parse import quote
+import asyncio
+import time
+from app.admission import acquire, admit, estimate_cost, release_after, request_priority
+from app.backends import load_seq2seq
+from app.batching import BatchScheduler, QueueFullError
+from app.cache import ResultCache, cache_key
+from app.model_registry import registry
+from app.quality import decoding as quality_decoding, max_input_tokens as quality_input_tokens, resolve as resolve_quality
+from app.streaming import ndjson_response
 
-app = FastAPI()
 router = APIRouter()
 
-# Allow CORS for your frontend domain
-origins = [
-    "http://localhost:5173",  # Replace with your frontend URL
-]
+# Register the model and tokenizer (loaded on first use)
+model_name = os.getenv("LIT_REVIEW_MODEL", "facebook/bart-large-cnn")
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],  # Allow all HTTP methods
-    allow_headers=["*"],  # Allow all headers
-)
+def load_model():
+    from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+    return load_seq2seq("literature_review", model_name, AutoModelForSeq2SeqLM, AutoTokenizer)
 
-# Load the model and tokenizer
-model_name = "facebook/bart-large-cnn"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+registry.register("literature_review", load_model)
+scheduler = BatchScheduler("literature_review")
+cache = ResultCache("literature_review")
+_generating = set()  # summarize_in_batches generation tasks, kept alive to completion
+
+# Abstracts are summarized in length-sorted batches of this size
+LIT_BATCH_SIZE = int(os.getenv("LIT_BATCH_SIZE", "8"))
+GENERATE_KWARGS = dict(max_length=150, min_length=30, length_penalty=2.0, num_beams=4, early_stopping=True)
+MAX_INPUT_TOKENS = 1024
 
 # Input model for summarizing papers
 class PaperRequest(BaseModel):
     topic: str
     num_papers: int
     papers: list  # List of dictionaries containing title, authors, year, and abstract
+    quality: Optional[str] = None  # fast, balanced, best or auto
 
 class SummarizedPaper(BaseModel):
     title: str
@@ -42,37 +48,181 @@ class SummarizedPaper(BaseModel):
     year: int
     summary: str  # Updated to match the field in the frontend
 
+def generate_kwargs(tier: str) -> dict:
+    return {**GENERATE_KWARGS, **quality_decoding(
+        tier, GENERATE_KWARGS["num_beams"], GENERATE_KWARGS["max_length"], GENERATE_KWARGS["min_length"]
+    )}
+
 # Function to summarize the paper abstract
-def summarize_text(text: str) -> str:
-    inputs = tokenizer.encode(text, return_tensors="pt", max_length=1024, truncation=True)
-    summary_ids = model.generate(inputs, max_length=150, min_length=30, length_penalty=2.0, num_beams=4, early_stopping=True)
-    summary = tokenizer.decode(summary_ids[0], skip_special_tokens=True)
+async def summarize_text(text: str, tier: str = "best") -> str:
+    async def generate_summary():
+        return (await scheduler.submit(
+            text, max_input_length=quality_input_tokens(tier, MAX_INPUT_TOKENS), **generate_kwargs(tier)
+        ))[0]
+
+    summary = await cache.get_or_compute(cache_key("summarize_text", model_name, text, quality=tier), generate_summary)
     return summary
 
+async def summarize_in_batches(texts: list, tier: str = "best"):
+    # Yields (indices, summaries, seconds) per batch as each one finishes.
+    # Cached abstracts come back first; the rest are tokenized together,
+    # sorted by length so each padded batch holds similar-sized inputs, and
+    # generated a batch at a time. Abstracts another request is already
+    # summarizing are waited for instead of being generated twice.
+    keys = [cache_key("summarize_text", model_name, text, quality=tier) for text in texts]
+    positions = {}
+    for i, key in enumerate(keys):
+        positions.setdefault(key, []).append(i)
+
+    def expand(batch_keys, summaries):
+        pairs = [(i, summary) for key, summary in zip(batch_keys, summaries) for i in positions[key]]
+        return [i for i, _ in pairs], [summary for _, summary in pairs]
+
+    found, pending, owned = await cache.get_many(list(positions))
+    if found:
+        yield (*expand(list(found), list(found.values())), 0.0)
+
+    results = asyncio.Queue()
+    if owned:
+        # Like get_or_compute, the generation runs as its own task, so a
+        # client that goes away doesn't fail it for the others waiting
+        task = asyncio.ensure_future(_generate_owned(owned, [texts[positions[key][0]] for key in owned], tier, results))
+        _generating.add(task)
+        task.add_done_callback(_generating.discard)
+    waiters = [asyncio.ensure_future(_wait_shared(key, future, results)) for key, future in pending.items()]
+    try:
+        remaining = len(owned) + len(pending)
+        while remaining:
+            batch_keys, summaries, elapsed, error = await results.get()
+            if error is not None:
+                raise error
+            remaining -= len(batch_keys)
+            yield (*expand(batch_keys, summaries), elapsed)
+    finally:
+        for waiter in waiters:
+            waiter.cancel()
+
+async def _wait_shared(key, future, results):
+    started = time.perf_counter()
+    try:
+        summary = await asyncio.shield(future)
+    except (Exception, asyncio.CancelledError) as e:
+        results.put_nowait(([key], None, 0.0, e))
+    else:
+        results.put_nowait(([key], [summary], time.perf_counter() - started, None))
+
+async def _generate_owned(keys, texts, tier, results):
+    # Summarizes the abstracts this request owns in the result cache and
+    # fills them in batch by batch; results go to `results` as
+    # (keys, summaries, seconds, error)
+    unfinished = set(keys)
+    try:
+        max_length = quality_input_tokens(tier, MAX_INPUT_TOKENS)
+        ids = await scheduler.run_with_tokenizer(
+            lambda tokenizer: tokenizer(texts, truncation=True, max_length=max_length)["input_ids"]
+        )
+        order = sorted(range(len(keys)), key=lambda j: len(ids[j]))
+        kwargs = generate_kwargs(tier)
+
+        async def run_batch(batch):
+            batch_keys = [keys[j] for j in batch]
+            started = time.perf_counter()
+            try:
+                outputs = await scheduler.submit_batch([ids[j] for j in batch], **kwargs)
+            except Exception as e:
+                results.put_nowait((batch_keys, None, 0.0, e))
+                for key in batch_keys:
+                    unfinished.discard(key)
+                    cache.fail(key, e)
+                return
+            summaries = [output[0] for output in outputs]
+            results.put_nowait((batch_keys, summaries, time.perf_counter() - started, None))
+            for key, summary in zip(batch_keys, summaries):
+                unfinished.discard(key)
+                await cache.fill(key, summary)
+
+        batches = [order[k:k + LIT_BATCH_SIZE] for k in range(0, len(order), LIT_BATCH_SIZE)]
+        await asyncio.gather(*(run_batch(batch) for batch in batches))
+    except BaseException as e:
+        if unfinished:
+            results.put_nowait((list(unfinished), None, 0.0, e))
+        for key in unfinished:
+            cache.fail(key, e)
+        if isinstance(e, asyncio.CancelledError):
+            raise
+
+def validate_papers(papers):
+    if not papers or len(papers) == 0:
+        raise HTTPException(status_code=400, detail="No papers provided for summarization")
+
+    for paper in papers:
+        if "abstract" not in paper:
+            raise HTTPException(status_code=400, detail="Missing abstract in paper data")
+
+def review_cost(papers, tier: str = "best") -> float:
+    abstracts = sum(len(paper["abstract"]) for paper in papers)
+    kwargs = generate_kwargs(tier)
+    return estimate_cost(abstracts, output_tokens=kwargs["max_length"] * len(papers), num_beams=kwargs["num_beams"])
+
+def to_summarized_paper(paper, summary):
+    return SummarizedPaper(
+        title=paper["title"],
+        authors=paper["authors"],
+        year=paper["year"],
+        summary=summary  # This is now 'summary' to match frontend
+    )
+
 # Route for summarizing papers
+# Literature reviews are bulk work: they are low priority unless the client says otherwise
 @router.post("/api/fetch-summarized-papers")
-async def fetch_summarized_papers(request: PaperRequest):
+async def fetch_summarized_papers(request: PaperRequest, priority: Optional[str] = Depends(request_priority)):
     try:
-        if not request.papers or len(request.papers) == 0:
-            raise HTTPException(status_code=400, detail="No papers provided for summarization")
-
-        summarized_papers = []
-        for paper in request.papers:
-            if "abstract" not in paper:
-                raise HTTPException(status_code=400, detail="Missing abstract in paper data")
-            summarized_abstract = summarize_text(paper["abstract"])
-            summarized_papers.append(SummarizedPaper(
-                title=paper["title"],
-                authors=paper["authors"],
-                year=paper["year"],
-                summary=summarized_abstract  # This is now 'summary' to match frontend
-            ))
-
-        return {"papers": summarized_papers}
+        validate_papers(request.papers)
+        tier = resolve_quality(request.quality, scheduler)
+
+        summaries = [None] * len(request.papers)
+        async with admit("heavy", review_cost(request.papers, tier), priority or "low"):
+            async for indices, batch_summaries, _ in summarize_in_batches([paper["abstract"] for paper in request.papers], tier):
+                for i, summary in zip(indices, batch_summaries):
+                    summaries[i] = summary
+
+        summarized_papers = [to_summarized_paper(paper, summary) for paper, summary in zip(request.papers, summaries)]
 
+        return {"papers": summarized_papers, "quality": tier}
+
+    except HTTPException:
+        raise
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Streaming variant: newline-delimited JSON, one {"type": "paper"} record per
+# paper as soon as its batch is done, a {"type": "batch"} record with the
+# batch timing after each batch, and a final {"type": "done"} record
+@router.post("/api/fetch-summarized-papers/stream")
+async def fetch_summarized_papers_stream(request: PaperRequest, priority: Optional[str] = Depends(request_priority)):
+    validate_papers(request.papers)
+    tier = resolve_quality(request.quality, scheduler)
+    ticket = await acquire("heavy", review_cost(request.papers, tier), priority or "low")
+
+    async def records():
+        started = time.perf_counter()
+        batches = summarize_in_batches([paper["abstract"] for paper in request.papers], tier)
+        try:
+            async for indices, summaries, elapsed in batches:
+                for i, summary in zip(indices, summaries):
+                    paper = to_summarized_paper(request.papers[i], summary)
+                    yield {"type": "paper", "index": i, "paper": jsonable_encoder(paper)}
+                yield {"type": "batch", "size": len(indices), "elapsed_ms": round(elapsed * 1000, 1)}
+            yield {"type": "done", "papers": len(request.papers), "quality": tier, "total_ms": round((time.perf_counter() - started) * 1000, 1)}
+        except Exception as e:
+            yield {"type": "error", "error": str(e)}
+        finally:
+            await batches.aclose()
+
+    return ndjson_response(release_after(ticket, records()), background=BackgroundTask(ticket.release))
+
 # Input model for generating a downloadable DOCX file
 class DownloadDocRequest(BaseModel):
     topic: str
@@ -80,51 +230,34 @@ class DownloadDocRequest(BaseModel):
 
 # Route to download a DOCX file with summarized papers
 @router.post("/api/download-doc")
-async def download_doc(request: DownloadDocRequest):
+async def download_doc(request: DownloadDocRequest, priority: Optional[str] = Depends(request_priority)):
     try:
         if not request.papers or len(request.papers) == 0:
             raise HTTPException(status_code=400, detail="No papers to include in the document")
 
-        # Create a new Document object
-        doc = Document()
-
-        # Add a title
-        doc.add_heading(f"Summarized Papers for Topic: {request.topic}", level=1)
-
-        # Add a table for the papers
-        table = doc.add_table(rows=1, cols=4)
-        table.autofit = True
-
-        # Add table headers
-        hdr_cells = table.rows[0].cells
-        hdr_cells[0].text = 'Paper Name'
-        hdr_cells[1].text = 'Publication Year'
-        hdr_cells[2].text = 'Author Names'
-        hdr_cells[3].text = 'Summary'
-
-        # Style the table headers
-        for cell in hdr_cells:
-            cell.font = doc.styles['Normal'].font
-            cell.font.size = Pt(11)
-            shading_elm = parse_xml(r'<w:shd {} w:fill="CCCCCC"/>'.format(nsdecls('w')))
-            cell._element.get_or_add_tcPr().append(shading_elm)
-
-        # Add each summarized paper to the table
-        for paper in request.papers:
-            row_cells = table.add_row().cells
-            row_cells[0].text = paper.title
-            row_cells[1].text = str(paper.year)
-            row_cells[2].text = paper.authors
-            row_cells[3].text = paper.summary
-
-        # Save the document as a DOCX file
-        file_path = f"summarized_papers_{request.topic}.docx"
-        doc.save(file_path)
-
-        # Return the file as a response for download
-        return FileResponse(file_path, filename=file_path)
+        # python-docx is only imported when someone actually exports
+        from app.docx_export import build_papers_docx
 
+        # Build the document in memory off the event loop; nothing touches disk
+        rows = [(paper.title, paper.year, paper.authors, paper.summary) for paper in request.papers]
+        async with admit("cheap", estimate_cost(sum(len(paper.summary) for paper in request.papers)), priority):
+            content = await asyncio.to_thread(build_papers_docx, request.topic, rows)
+
+        # Stream the bytes back as the download
+        filename = f"summarized_papers_{request.topic}.docx"
+        headers = {
+            "Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}",
+            "Content-Length": str(len(content)),
+        }
+        chunk_size = 64 * 1024
+        chunks = (content[i:i + chunk_size] for i in range(0, len(content), chunk_size))
+        return StreamingResponse(
+            chunks,
+            media_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+            headers=headers,
+        )
+
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-
-app.include_router(router, prefix="/lit", tags=["Literature Review Generator"])
\ No newline at end of file
@@ -0,0 +1,220 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+# Prometheus metrics and per-request Server-Timing.
+#
+# Every request is timed end to end by MetricsMiddleware, and the hot paths
+# time their own stages (upload, extraction, tokenize, queue, generate,
+# decode, upstream, languagetool, ...) into one histogram labelled by stage,
+# route and model. Counters track input/output tokens and errors. GET /metrics
+# serves everything in the Prometheus text format.
+#
+# Recording is a bisect plus a few additions under a lock, cheap enough to
+# leave on. The route label is the matched route template, never the raw
+# path, so label cardinality stays bounded.
+#
+# Server-Timing is opt-in: send `X-Server-Timing: 1` with a request, or set
+# SERVER_TIMING=1 to add the header to every response.
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+router = APIRouter()
+_metrics = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra="") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, amount=1, *labels):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_labels(self.label_names, labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value: float, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            series = [(labels, list(values)) for labels, values in self._series.items()]
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), values):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_labels(self.label_names, labels)} {values[-1]}"
+            yield f"{self.name}_count{_labels(self.label_names, labels)} {cumulative}"
+
+
+REQUEST_SECONDS = Histogram(
+    "textcraft_request_duration_seconds", "End-to-end request latency.", ("route", "method", "status")
+)
+STAGE_SECONDS = Histogram(
+    "textcraft_stage_duration_seconds", "Time spent in one stage of a request.", ("stage", "route", "model")
+)
+INPUT_TOKENS = Counter("textcraft_input_tokens_total", "Tokens sent to a model.", ("route", "model"))
+OUTPUT_TOKENS = Counter("textcraft_output_tokens_total", "Tokens generated by a model.", ("route", "model"))
+ERRORS = Counter("textcraft_errors_total", "Failed requests and failed upstream calls.", ("route", "kind"))
+
+
+class _Request:
+    __slots__ = ("scope", "timings")
+
+    def __init__(self, scope, server_timing):
+        self.scope = scope
+        self.timings = {} if server_timing else None
+
+    @property
+    def route(self) -> str:
+        # FastAPI's router stores the matched route in the scope
+        route = self.scope.get("route")
+        if route is not None:
+            return route.path
+        endpoint = self.scope.get("endpoint")
+        return getattr(endpoint, "__name__", "unmatched")
+
+
+_current = ContextVar("textcraft_request", default=None)
+
+
+def current_route() -> str:
+    request = _current.get()
+    return request.route if request is not None else "background"
+
+
+def add_timings(timings: dict):
+    # Adds already recorded stage times to the current request's Server-Timing
+    request = _current.get()
+    if request is not None and request.timings is not None:
+        for stage, seconds in timings.items():
+            request.timings[stage] = request.timings.get(stage, 0.0) + seconds
+
+
+def observe(stage: str, seconds: float, model: str = "", route: str = None):
+    STAGE_SECONDS.observe(seconds, stage, route or current_route(), model)
+    add_timings({stage: seconds})
+
+
+@contextmanager
+def timed(stage: str, model: str = ""):
+    # with metrics.timed("upstream", model=GROQ_MODEL): ...
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started, model)
+
+
+def count_tokens(input_tokens: int = 0, output_tokens: int = 0, model: str = "", route: str = None):
+    route = route or current_route()
+    if input_tokens:
+        INPUT_TOKENS.inc(input_tokens, route, model)
+    if output_tokens:
+        OUTPUT_TOKENS.inc(output_tokens, route, model)
+
+
+def count_error(kind: str, route: str = None):
+    ERRORS.inc(1, route or current_route(), kind)
+
+
+def _server_timing_header(timings: dict, total: float) -> bytes:
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries).encode("latin-1")
+
+
+class MetricsMiddleware:
+    # Plain ASGI middleware: no extra task per request, streaming untouched
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        server_timing = SERVER_TIMING or (b"x-server-timing", b"1") in scope.get("headers", ())
+        request = _Request(scope, server_timing)
+        token = _current.set(request)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if request.timings is not None:
+                    header = _server_timing_header(request.timings, time.perf_counter() - started)
+                    message = {**message, "headers": [*message.get("headers", []), (b"server-timing", header)]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            route = request.route
+            REQUEST_SECONDS.observe(time.perf_counter() - started, route, scope["method"], str(status))
+            if status >= 400:
+                ERRORS.inc(1, route, f"http_{status // 100}xx")
+
+
+def render() -> str:
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+@router.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,225 @@
+import asyncio
+import ctypes
+import gc
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from app import stats
+from app.inference import run_inference
+
+logger = logging.getLogger(__name__)
+
+# Central registry of the heavy models.
+#
+# Nothing is loaded at import time: each module registers a loader, and the
+# model is loaded the first time a request needs it. The registry tracks every
+# loaded model's resident size and keeps the total under MODEL_MEMORY_BUDGET_MB
+# by unloading the least recently used models that are neither pinned nor in
+# use. MODEL_PIN lists models that are never evicted, MODEL_PRELOAD lists the
+# ones loaded at startup ("all" for every registered model).
+MODEL_MEMORY_BUDGET_MB = float(os.getenv("MODEL_MEMORY_BUDGET_MB", "0"))  # 0 = unlimited
+MODEL_PIN = [name.strip() for name in os.getenv("MODEL_PIN", "").split(",") if name.strip()]
+MODEL_PRELOAD = [name.strip() for name in os.getenv("MODEL_PRELOAD", "").split(",") if name.strip()]
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _resident_size(model, rss_delta: int) -> int:
+    # Exact for torch modules (parameters + buffers); RSS growth during the
+    # load for anything else, e.g. ONNX Runtime sessions
+    try:
+        tensors = list(model.parameters()) + list(model.buffers())
+        size = sum(t.numel() * t.element_size() for t in tensors)
+        if size:
+            return size
+    except AttributeError:
+        pass
+    return max(rss_delta, 0)
+
+
+def _release_memory():
+    gc.collect()
+    try:
+        # Give freed arenas back to the OS so RSS actually drops (glibc only)
+        ctypes.CDLL("libc.so.6").malloc_trim(0)
+    except (OSError, AttributeError):
+        pass
+
+
+class _Entry:
+    __slots__ = ("tokenizer", "model", "size", "in_use", "load_seconds", "last_used")
+
+    def __init__(self, tokenizer, model, size, load_seconds):
+        self.tokenizer = tokenizer
+        self.model = model
+        self.size = size
+        self.in_use = 0
+        self.load_seconds = load_seconds
+        self.last_used = time.time()
+
+
+class ModelRegistry:
+    def __init__(self, budget_mb: float = MODEL_MEMORY_BUDGET_MB, pinned=MODEL_PIN):
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.pinned = set(pinned)
+        self._loaders = {}
+        self._entries = OrderedDict()  # least recently used first
+        self._loading = {}
+        self._last_size = {}
+        self._loads = {}
+        self._unloads = {}
+        self.events = deque(maxlen=200)
+
+    def register(self, name: str, loader):
+        # `loader` is a blocking callable returning (tokenizer, model)
+        self._loaders[name] = loader
+
+    def registered(self) -> list:
+        return list(self._loaders)
+
+    def pin(self, name: str):
+        self.pinned.add(name)
+
+    def total_size(self) -> int:
+        return sum(entry.size for entry in self._entries.values())
+
+    def _event(self, kind, name, **details):
+        event = {"event": kind, "model": name, "time": time.time(), **details}
+        self.events.append(event)
+        logger.info("model %s %s %s", kind, name, details)
+
+    def _evict(self, needed: int):
+        if not self.budget:
+            return
+        for name in list(self._entries):
+            if self.total_size() + needed <= self.budget:
+                return
+            entry = self._entries[name]
+            if name in self.pinned or entry.in_use:
+                continue
+            self.unload(name, reason="budget")
+
+    def unload(self, name: str, reason: str = "manual"):
+        entry = self._entries.pop(name, None)
+        if entry is None:
+            return
+        self._unloads[name] = self._unloads.get(name, 0) + 1
+        self._event("unload", name, reason=reason, size_mb=round(entry.size / 2 ** 20, 1))
+        del entry
+        _release_memory()
+
+    async def _load(self, name):
+        if name not in self._loaders:
+            raise KeyError(f"No model registered as {name!r}")
+
+        # Make room up front when we know roughly how big the model is
+        self._evict(self._last_size.get(name, 0))
+
+        tokenizer, model, seconds, rss_delta = await run_inference(name, self._run_loader, name)
+        entry = self._add(name, tokenizer, model, seconds, rss_delta)
+
+        # The new model might have pushed us over; never evict it straight away
+        entry.in_use += 1
+        self._evict(0)
+        entry.in_use -= 1
+        if self.budget and self.total_size() > self.budget:
+            self._event("over_budget", name, total_mb=round(self.total_size() / 2 ** 20, 1))
+        return entry
+
+    def _run_loader(self, name):
+        # Blocking
+        rss_before = _rss_bytes()
+        started = time.perf_counter()
+        tokenizer, model = self._loaders[name]()
+        return tokenizer, model, time.perf_counter() - started, _rss_bytes() - rss_before
+
+    def _add(self, name, tokenizer, model, seconds, rss_delta, **details):
+        entry = _Entry(tokenizer, model, _resident_size(model, rss_delta), seconds)
+        self._entries[name] = entry
+        self._last_size[name] = entry.size
+        self._loads[name] = self._loads.get(name, 0) + 1
+        self._event("load", name, seconds=round(seconds, 2), size_mb=round(entry.size / 2 ** 20, 1), **details)
+        return entry
+
+    def load_shared(self, name: str):
+        # Blocking load outside any event loop, for the prefork server: the
+        # parent loads the model once and every forked worker inherits it.
+        # Shared models are pinned; unloading one in a worker would only drop
+        # that worker's reference, never the memory.
+        if name not in self._loaders:
+            raise KeyError(f"No model registered as {name!r}")
+        if name not in self._entries:
+            self._add(name, *self._run_loader(name), shared=True)
+        self.pin(name)
+        return self._entries[name]
+
+    async def acquire(self, name: str) -> _Entry:
+        entry = self._entries.get(name)
+        if entry is None:
+            task = self._loading.get(name)
+            if task is None:
+                task = self._loading[name] = asyncio.ensure_future(self._load(name))
+                task.add_done_callback(lambda t: self._loading.pop(name, None))
+            entry = await asyncio.shield(task)
+            # It may have been evicted again while we waited
+            if self._entries.get(name) is not entry:
+                return await self.acquire(name)
+        self._entries.move_to_end(name)
+        entry.in_use += 1
+        entry.last_used = time.time()
+        return entry
+
+    def release(self, entry: _Entry):
+        entry.in_use -= 1
+
+    @asynccontextmanager
+    async def use(self, name: str):
+        # async with registry.use("summarizer") as (tokenizer, model): ...
+        entry = await self.acquire(name)
+        try:
+            yield entry.tokenizer, entry.model
+        finally:
+            self.release(entry)
+
+    async def preload(self, names=None):
+        names = names if names is not None else MODEL_PRELOAD
+        if "all" in names:
+            names = list(self._loaders)
+        for name in names:
+            if name in self._loaders:
+                self.release(await self.acquire(name))
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._entries
+
+    def snapshot(self):
+        return {
+            "budget_mb": round(self.budget / 2 ** 20, 1) if self.budget else None,
+            "total_mb": round(self.total_size() / 2 ** 20, 1),
+            "models": {
+                name: {
+                    "loaded": name in self._entries,
+                    "pinned": name in self.pinned,
+                    "size_mb": round(self._entries[name].size / 2 ** 20, 1) if name in self._entries else None,
+                    "in_use": self._entries[name].in_use if name in self._entries else 0,
+                    "load_seconds": round(self._entries[name].load_seconds, 2) if name in self._entries else None,
+                    "loads": self._loads.get(name, 0),
+                    "unloads": self._unloads.get(name, 0),
+                }
+                for name in self._loaders
+            },
+            "events": list(self.events)[-20:],
+        }
+
+
+registry = ModelRegistry()
+stats.register("models", registry.snapshot)
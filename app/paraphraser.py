@@ -1,45 +1,156 @@
-from fastapi import FastAPI, Request,APIRouter
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from transformers import PegasusForConditionalGeneration, PegasusTokenizer
-from typing import List
-import nltk
-
-nltk.download('punkt_tab')
+from typing import List, Optional
+import asyncio
+import math
+import os
+from app.admission import admit, estimate_cost, request_priority
+from app.backends import load_seq2seq
+from app.chunking import split_sentences
+from app.model_registry import registry
+from app.quality import decoding as quality_decoding, resolve as resolve_quality
+from app.batching import BatchScheduler, QueueFullError
+from app.cache import ResultCache, cache_key
 
 
 router=APIRouter()
 
-# Load the Pegasus paraphrase model and tokenizer
-model_name = "tuner007/pegasus_paraphrase"
-tokenizer = PegasusTokenizer.from_pretrained(model_name)
-model = PegasusForConditionalGeneration.from_pretrained(model_name)
+# Register the Pegasus paraphrase model and tokenizer (loaded on first use)
+model_name = os.getenv("PARAPHRASER_MODEL", "tuner007/pegasus_paraphrase")
+
+def load_model():
+    from transformers import PegasusForConditionalGeneration, PegasusTokenizer
+    return load_seq2seq("paraphraser", model_name, PegasusForConditionalGeneration, PegasusTokenizer)
+
+registry.register("paraphraser", load_model)
+scheduler = BatchScheduler("paraphraser")
+cache = ResultCache("paraphraser")
+
+# Document mode paraphrases each sentence separately (the model only takes
+# 60 tokens) in length-sorted padded batches and joins the results back up.
+# Its cost grows with sentences x beams x return sequences, so a request is
+# held to a compute budget: beams x sequences is capped first (beams are
+# lowered, never below the number of sequences), then the total; a document
+# that still doesn't fit is rejected.
+PARAPHRASE_MAX_SENTENCES = int(os.getenv("PARAPHRASE_MAX_SENTENCES", "64"))
+PARAPHRASE_MAX_BEAMS_X_SEQUENCES = int(os.getenv("PARAPHRASE_MAX_BEAMS_X_SEQUENCES", "50"))
+PARAPHRASE_COMPUTE_BUDGET = int(os.getenv("PARAPHRASE_COMPUTE_BUDGET", "1600"))  # sentences x beams x sequences
+PARAPHRASE_BATCH_SIZE = int(os.getenv("PARAPHRASE_BATCH_SIZE", "16"))
+SENTENCE_MAX_TOKENS = 60
+
+
+class BudgetError(ValueError):
+    pass
 
-app = FastAPI()
 
 # Define a request model for input data
 class ParaphraseRequest(BaseModel):
     text: str
     num_paraphrases: int = 5
     num_beams: int = 10
+    mode: str = "single"  # "single": the whole text at once, "document": sentence by sentence
+    quality: Optional[str] = None  # fast, balanced, best or auto
 
 # Paraphrasing function
-def paraphrase_text(text: str, num_return_sequences: int = 5, num_beams: int = 10) -> List[str]:
-    inputs = tokenizer(text, truncation=True, padding="longest", return_tensors="pt")
-    paraphrase_ids = model.generate(
-        inputs['input_ids'],
-        num_beams=num_beams,
-        num_return_sequences=num_return_sequences,
-        temperature=1.5,
-        max_length=60
-    )
-    paraphrases = [tokenizer.decode(p, skip_special_tokens=True) for p in paraphrase_ids]
+async def paraphrase_text(text: str, num_return_sequences: int = 5, num_beams: int = 10) -> List[str]:
+    async def generate_paraphrases():
+        return await scheduler.submit(
+            text,
+            max_input_length=None,
+            num_beams=num_beams,
+            num_return_sequences=num_return_sequences,
+            temperature=1.5,
+            max_length=60
+        )
+
+    key = cache_key("paraphrase", model_name, text, num_return_sequences=num_return_sequences, num_beams=num_beams)
+    paraphrases = await cache.get_or_compute(key, generate_paraphrases)
     return paraphrases
 
+def fit_budget(num_sentences: int, num_return_sequences: int, num_beams: int):
+    # Returns the (num_return_sequences, num_beams) actually used
+    if num_sentences > PARAPHRASE_MAX_SENTENCES:
+        raise BudgetError(f"Text has {num_sentences} sentences, the limit is {PARAPHRASE_MAX_SENTENCES}.")
+    # Beam search needs num_beams >= num_return_sequences, so both fit under
+    # the per-sentence cap only while sequences <= sqrt(cap)
+    num_return_sequences = max(1, min(num_return_sequences, math.isqrt(PARAPHRASE_MAX_BEAMS_X_SEQUENCES)))
+    per_sentence = min(PARAPHRASE_MAX_BEAMS_X_SEQUENCES, PARAPHRASE_COMPUTE_BUDGET // max(num_sentences, 1))
+    num_beams = max(num_return_sequences, min(num_beams, per_sentence // num_return_sequences))
+    if num_sentences * num_beams * num_return_sequences > PARAPHRASE_COMPUTE_BUDGET:
+        raise BudgetError(
+            f"{num_sentences} sentences x {num_return_sequences} paraphrases is over the compute budget; "
+            "ask for fewer paraphrases or send a shorter text."
+        )
+    return num_return_sequences, num_beams
+
+def document_sentences(text: str) -> list:
+    return [sentence for sentence in split_sentences(text) if sentence.strip()]
+
+async def paraphrase_document(text: str, num_return_sequences: int = 5, num_beams: int = 10, sentences: list = None) -> dict:
+    if sentences is None:
+        sentences = document_sentences(text)
+    if not sentences:
+        return {"paraphrases": [], "sentences": 0, "num_paraphrases": num_return_sequences, "num_beams": num_beams}
+    num_return_sequences, num_beams = fit_budget(len(sentences), num_return_sequences, num_beams)
+
+    async def generate_document():
+        ids = await scheduler.run_with_tokenizer(
+            lambda tokenizer: tokenizer(sentences, truncation=True, max_length=SENTENCE_MAX_TOKENS)["input_ids"]
+        )
+        order = sorted(range(len(sentences)), key=lambda i: len(ids[i]))
+        batches = [order[k:k + PARAPHRASE_BATCH_SIZE] for k in range(0, len(order), PARAPHRASE_BATCH_SIZE)]
+        results = await asyncio.gather(*(
+            scheduler.submit_batch(
+                [ids[i] for i in batch],
+                num_beams=num_beams,
+                num_return_sequences=num_return_sequences,
+                temperature=1.5,
+                max_length=SENTENCE_MAX_TOKENS,
+            )
+            for batch in batches
+        ))
+        per_sentence = [None] * len(sentences)
+        for batch, outputs in zip(batches, results):
+            for i, output in zip(batch, outputs):
+                per_sentence[i] = output
+        # The k-th paraphrase of the document is the k-th candidate of every sentence
+        return [" ".join(candidates[k] for candidates in per_sentence) for k in range(num_return_sequences)]
+
+    key = cache_key(
+        "paraphrase_document", model_name, text, num_return_sequences=num_return_sequences, num_beams=num_beams
+    )
+    paraphrases = await cache.get_or_compute(key, generate_document)
+    return {
+        "paraphrases": paraphrases,
+        "sentences": len(sentences),
+        "num_paraphrases": num_return_sequences,
+        "num_beams": num_beams,
+    }
+
 # FastAPI route to paraphrase text
 @router.post("/paraphrase")
-async def paraphrase(request: ParaphraseRequest):
-    paraphrases = paraphrase_text(request.text, request.num_paraphrases, request.num_beams)
-    return {"paraphrases": paraphrases}
-
-# Run with: uvicorn main:app --reload
-app.include_router(router, prefix="/paraphraser", tags=["Text Paraphraser"])
\ No newline at end of file
+async def paraphrase(request: ParaphraseRequest, priority: Optional[str] = Depends(request_priority)):
+    if request.mode not in ("single", "document"):
+        raise HTTPException(status_code=400, detail="mode must be 'single' or 'document'")
+    try:
+        tier = resolve_quality(request.quality, scheduler)
+        sentences = document_sentences(request.text) if request.mode == "document" else None
+        num_paraphrases, num_beams = fit_budget(len(sentences) if sentences else 1, request.num_paraphrases, request.num_beams)
+        # Outputs are already short, so the tier only narrows the beam search
+        num_beams = quality_decoding(tier, num_beams, SENTENCE_MAX_TOKENS, num_return_sequences=num_paraphrases)["num_beams"]
+        cost = estimate_cost(
+            len(request.text),
+            output_tokens=SENTENCE_MAX_TOKENS * (len(sentences) if sentences else 1),
+            num_beams=num_beams,
+            num_return_sequences=num_paraphrases,
+        )
+        async with admit("heavy", cost, priority):
+            if sentences is not None:
+                result = await paraphrase_document(request.text, num_paraphrases, num_beams, sentences=sentences)
+                return {**result, "quality": tier}
+            paraphrases = await paraphrase_text(request.text, num_paraphrases, num_beams)
+    except BudgetError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return {"paraphrases": paraphrases, "quality": tier}
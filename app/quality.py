@@ -0,0 +1,92 @@
+import os
+
+from fastapi import HTTPException
+
+from app import metrics, stats
+from app.admission import classes
+
+# Generation quality tiers for the seq2seq routes.
+#
+# "best" decodes with each route's own settings. "balanced" narrows beam
+# search to QUALITY_BALANCED_MAX_BEAMS. "fast" is greedy (or as few beams as
+# the requested number of return sequences allows), caps the output at
+# QUALITY_FAST_MAX_LENGTH tokens and truncates input at
+# QUALITY_FAST_MAX_INPUT_TOKENS.
+#
+# A request picks a tier with `quality=fast|balanced|best|auto`, or gets
+# QUALITY_DEFAULT. "auto" looks at the model's load when the request arrives:
+# full batches waiting in its scheduler, cost queued in the heavy admission
+# class, and the recent per-batch latency against QUALITY_TARGET_SECONDS.
+# Below QUALITY_BALANCED_AT it picks "best", below QUALITY_FAST_AT
+# "balanced", and "fast" above that. The tier used is part of every cache key
+# and is returned in the response as `quality`.
+TIERS = ("fast", "balanced", "best")
+MODES = TIERS + ("auto",)
+QUALITY_DEFAULT = os.getenv("QUALITY_DEFAULT", "auto")
+QUALITY_BALANCED_MAX_BEAMS = int(os.getenv("QUALITY_BALANCED_MAX_BEAMS", "2"))
+QUALITY_FAST_MAX_LENGTH = int(os.getenv("QUALITY_FAST_MAX_LENGTH", "96"))
+QUALITY_FAST_MAX_INPUT_TOKENS = int(os.getenv("QUALITY_FAST_MAX_INPUT_TOKENS", "512"))
+QUALITY_TARGET_SECONDS = float(os.getenv("QUALITY_TARGET_SECONDS", "5"))
+QUALITY_BALANCED_AT = float(os.getenv("QUALITY_BALANCED_AT", "1"))
+QUALITY_FAST_AT = float(os.getenv("QUALITY_FAST_AT", "2"))
+
+TIER_CHOSEN = metrics.Counter(
+    "textcraft_quality_tier_total", "Requests served per quality tier.", ("model", "tier", "requested")
+)
+
+_chosen = {}
+
+
+def load_level(scheduler) -> float:
+    # 0 when idle; 1 is about one full batch waiting, a full heavy admission
+    # slot queued, or batches taking QUALITY_TARGET_SECONDS
+    queued_batches = scheduler.queue_depth / max(scheduler.max_batch_size, 1)
+    heavy = classes["heavy"]
+    queued_cost = heavy.queued / max(heavy.max_inflight, 1)
+    # A latency reading from before an idle spell says nothing about now
+    busy = scheduler.queue_depth or scheduler.inflight_batches
+    latency = scheduler.recent_latency / QUALITY_TARGET_SECONDS if busy else 0.0
+    return max(queued_batches, queued_cost, latency)
+
+
+def resolve(requested, scheduler) -> str:
+    # Returns the tier to use; raises HTTPException(400) for an unknown one
+    requested = (requested or QUALITY_DEFAULT).lower()
+    if requested == "auto":
+        level = load_level(scheduler)
+        tier = "best" if level < QUALITY_BALANCED_AT else "balanced" if level < QUALITY_FAST_AT else "fast"
+    elif requested in TIERS:
+        tier = requested
+    else:
+        raise HTTPException(status_code=400, detail="quality must be one of fast, balanced, best or auto")
+    TIER_CHOSEN.inc(1, scheduler.name, tier, requested)
+    key = (scheduler.name, tier)
+    _chosen[key] = _chosen.get(key, 0) + 1
+    return tier
+
+
+def decoding(tier: str, num_beams: int, max_length: int, min_length: int = None, num_return_sequences: int = 1) -> dict:
+    # The route's generation settings, degraded for the tier
+    if tier == "balanced":
+        num_beams = min(num_beams, max(QUALITY_BALANCED_MAX_BEAMS, num_return_sequences))
+    elif tier == "fast":
+        num_beams = num_return_sequences
+        max_length = min(max_length, QUALITY_FAST_MAX_LENGTH)
+    kwargs = {"num_beams": num_beams, "max_length": max_length}
+    if min_length is not None:
+        kwargs["min_length"] = min(min_length, max_length // 2)
+    return kwargs
+
+
+def max_input_tokens(tier: str, default: int) -> int:
+    return min(default, QUALITY_FAST_MAX_INPUT_TOKENS) if tier == "fast" and default else default
+
+
+def snapshot():
+    by_model = {}
+    for (model, tier), count in _chosen.items():
+        by_model.setdefault(model, {})[tier] = count
+    return {"default": QUALITY_DEFAULT, "chosen": by_model}
+
+
+stats.register("quality", snapshot)
@@ -0,0 +1,93 @@
+import argparse
+import os
+
+# Startup never touches the network. NLTK data, Hugging Face checkpoints and
+# LanguageTool must already be on disk (bundled in the image or fetched once
+# with `python -m app.resources fetch`); when something is missing we fail
+# with a message saying exactly that instead of silently downloading.
+#
+# Set TEXTCRAFT_ALLOW_DOWNLOADS=1 to let Hugging Face download on demand.
+ALLOW_DOWNLOADS = os.getenv("TEXTCRAFT_ALLOW_DOWNLOADS", "0") == "1"
+if not ALLOW_DOWNLOADS:
+    # Read by huggingface_hub / transformers when they are first imported
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+NLTK_RESOURCES = {
+    "punkt": "tokenizers/punkt",
+    "punkt_tab": "tokenizers/punkt_tab",
+}
+
+HF_MODELS = (
+    os.getenv("SUMMARIZER_MODEL", "google/pegasus-large"),
+    os.getenv("PARAPHRASER_MODEL", "tuner007/pegasus_paraphrase"),
+    os.getenv("LIT_REVIEW_MODEL", "facebook/bart-large-cnn"),
+) + tuple(
+    # Draft models for assisted decoding, where configured
+    os.environ[key] for key in sorted(os.environ) if key.startswith("ASSISTED_DRAFT_MODEL_") and os.environ[key]
+)
+
+FETCH_HINT = "Run `python -m app.resources fetch` once (with network access) or bundle it in the image."
+
+
+class MissingResourceError(RuntimeError):
+    pass
+
+
+def check_nltk():
+    import nltk
+
+    for name, path in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            raise MissingResourceError(f"NLTK resource {name!r} is not installed. {FETCH_HINT}") from None
+
+
+def missing_model_error(model_name: str, error: Exception) -> MissingResourceError:
+    return MissingResourceError(f"Model {model_name!r} is not in the local Hugging Face cache ({error}). {FETCH_HINT}")
+
+
+def fetch(models=HF_MODELS, languagetool=True):
+    import nltk
+    from huggingface_hub import snapshot_download
+
+    for name in NLTK_RESOURCES:
+        nltk.download(name)
+    for model_name in models:
+        print(f"Fetching {model_name}")
+        snapshot_download(model_name)
+    if languagetool:
+        from language_tool_python.download_lt import download_lt
+
+        download_lt()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the offline resources needed at startup")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    fetch_parser = subparsers.add_parser("fetch", help="download NLTK data, model checkpoints and LanguageTool")
+    fetch_parser.add_argument("--models", nargs="*", default=list(HF_MODELS))
+    fetch_parser.add_argument("--skip-languagetool", action="store_true")
+    subparsers.add_parser("check", help="verify everything needed offline is present")
+    args = parser.parse_args()
+
+    if args.command == "fetch":
+        # Fetching needs the network even if offline mode is configured
+        os.environ["HF_HUB_OFFLINE"] = "0"
+        os.environ["TRANSFORMERS_OFFLINE"] = "0"
+        fetch(args.models, languagetool=not args.skip_languagetool)
+    else:
+        from huggingface_hub import snapshot_download
+
+        check_nltk()
+        for model_name in HF_MODELS:
+            try:
+                snapshot_download(model_name, local_files_only=True)
+            except Exception as e:
+                raise missing_model_error(model_name, e)
+        print("All offline resources are present.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+from app.model_registry import MODEL_PRELOAD, registry
+
+logger = logging.getLogger(__name__)
+
+# Prefork server that shares model weights between workers.
+#
+# `uvicorn --workers N` starts N independent interpreters and each one loads
+# its own copy of every model. Here the parent imports the app, loads the
+# shared models once, then forks the workers, which inherit the weights
+# copy-on-write. Nothing in inference writes to the weight pages, so they
+# stay shared and each worker only adds its own code and activations:
+#
+#   python -m app.serve --workers 4 --port 8000
+#
+# Weights are frozen (eval, no grad) before forking, and gc.freeze() moves
+# every object the parent created out of the collector's reach, so a worker's
+# GC never touches (and copies) the pages they live on. SHARED_WEIGHTS_MODE=shm
+# additionally moves torch tensors into shared memory, which keeps them shared
+# even if something does write to them; it needs a /dev/shm as large as the
+# models (container defaults are often 64 MB).
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "2"))
+SHARED_MODELS = [
+    name.strip() for name in os.getenv("SHARED_MODELS", ",".join(MODEL_PRELOAD) or "all").split(",") if name.strip()
+]
+SHARED_WEIGHTS_MODE = os.getenv("SHARED_WEIGHTS_MODE", "cow")  # cow | shm
+SERVE_THREADS_PER_WORKER = int(os.getenv("SERVE_THREADS_PER_WORKER", "0"))  # 0 = cpus / workers
+SERVE_POLL_INTERVAL = 0.5
+
+
+def freeze_weights(model):
+    # ONNX Runtime sessions have no torch parameters; copy-on-write covers them
+    if not hasattr(model, "parameters"):
+        return
+    model.eval()
+    for parameter in model.parameters():
+        parameter.requires_grad_(False)
+    if SHARED_WEIGHTS_MODE == "shm":
+        model.share_memory()
+
+
+def load_shared_models(names):
+    if "all" in names:
+        names = registry.registered()
+    for name in names:
+        if name not in registry.registered():
+            logger.warning("not sharing %s: no model registered under that name", name)
+            continue
+        entry = registry.load_shared(name)
+        freeze_weights(entry.model)
+        logger.info("loaded %s for sharing (%.0f MB)", name, entry.size / 2 ** 20)
+
+
+def _bind(host, port):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, sock, threads, log_level):
+    import uvicorn
+
+    # The parent's handlers are inherited; uvicorn installs its own
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+    uvicorn.Server(uvicorn.Config(app, log_level=log_level)).run(sockets=[sock])
+
+
+def _spawn(app, sock, threads, log_level):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            _run_worker(app, sock, threads, log_level)
+        except BaseException:
+            logger.exception("worker crashed")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def serve(host="127.0.0.1", port=8000, workers=SERVE_WORKERS, shared_models=SHARED_MODELS, log_level="info"):
+    from main import app
+
+    load_shared_models(shared_models)
+    # Everything allocated so far is long-lived and shared with the workers
+    gc.collect()
+    gc.freeze()
+
+    # One set of job workers for the whole server, not one per API worker
+    from app import jobs
+    jobs.start_workers()
+
+    threads = SERVE_THREADS_PER_WORKER or max(1, (os.cpu_count() or 1) // workers)
+    sock = _bind(host, port)
+    children = {_spawn(app, sock, threads, log_level) for _ in range(workers)}
+    logger.info("serving on %s:%d with %d workers (%d threads each)", host, port, workers, threads)
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    # Only the API workers are waited on here: the job workers are
+    # multiprocessing children, checked and restarted by the jobs module
+    while children:
+        for pid in list(children):
+            try:
+                exited, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                exited, status = pid, 0
+            if not exited:
+                continue
+            children.discard(pid)
+            if not stopping:
+                # A worker died on its own: replace it, the weights are still here
+                logger.warning("worker %d exited with status %d, restarting", pid, status)
+                time.sleep(1)
+                children.add(_spawn(app, sock, threads, log_level))
+        if not stopping:
+            jobs.restart_dead_workers()
+        time.sleep(SERVE_POLL_INTERVAL)
+    jobs.stop_workers()
+    sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API with model weights shared across forked workers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS)
+    parser.add_argument("--shared-models", default=",".join(SHARED_MODELS),
+                        help="comma-separated models loaded before forking, or 'all'")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=args.log_level.upper(), format="%(asctime)s %(process)d %(name)s %(message)s")
+    shared = [name.strip() for name in args.shared_models.split(",") if name.strip()]
+    serve(args.host, args.port, args.workers, shared, args.log_level)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,49 @@
-from fastapi import FastAPI, APIRouter
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
 from pydantic import BaseModel  # Import Pydantic BaseModel
-import language_tool_python
+from typing import List, Optional
+import asyncio
+import os
+from app.admission import admit, estimate_cost, request_priority
+from app.cache import ResultCache, cache_key
+from app.languagetool_pool import pool
+from app.spellcheck_session import Document, EditError, session_closed, session_opened
 
 
-app = FastAPI()
 router = APIRouter()
 
+cache = ResultCache("spellcheck")
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["http://localhost:5173"],  
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Create a LanguageTool object f
-tool = language_tool_python.LanguageTool('en-US')
+SPELLCHECK_BATCH_MAX_TEXTS = int(os.getenv("SPELLCHECK_BATCH_MAX_TEXTS", "500"))
 
 
 class SpellCheckRequest(BaseModel):
     text: str
 
 
-@router.post("/correct-text")
-async def spell_check(request: SpellCheckRequest):  
-    text = request.text  
-    print(text)
-    errors = tool.check(text)
+class SpellCheckBatchRequest(BaseModel):
+    texts: List[str]
+
+
+def apply_corrections(text, matches):
+    # Same result as tool.correct(text), built from matches we already have
+    # instead of running a second full LanguageTool check
+    pieces = []
+    position = 0
+    for match in sorted(matches, key=lambda m: m.offset):
+        if not match.replacements or match.offset < position:
+            continue
+        pieces.append(text[position:match.offset])
+        pieces.append(match.replacements[0])
+        position = match.offset + match.errorLength
+    pieces.append(text[position:])
+    return "".join(pieces)
+
+
+async def check_text(text):
+    # One LanguageTool pass on the least-loaded server in the pool
+    errors = await pool.check(text)
 
- 
-    corrected_text = tool.correct(text)
-    print(corrected_text)
+    corrected_text = apply_corrections(text, errors)
 
     grammar_corrections = []
     for match in errors:
@@ -41,12 +53,134 @@ async def spell_check(request: SpellCheckRequest):
             "message": match.message
         })
 
-    print(grammar_corrections)    
-
-
     return {
         "corrected_text": corrected_text,
         "grammar_corrections": grammar_corrections
     }
 
-app.include_router(router, prefix="/spellCheck", tags=["Image To Text"])
+
+async def check_text_cached(text):
+    # Offsets depend on the exact text, so the key hashes it byte for byte
+    key = cache_key("spellcheck", "languagetool-en-US", text.encode())
+    return await cache.get_or_compute(key, lambda: check_text(text))
+
+
+@router.post("/correct-text")
+async def spell_check(request: SpellCheckRequest, priority: Optional[str] = Depends(request_priority)):
+    async with admit("cheap", estimate_cost(len(request.text)), priority):
+        return await check_text_cached(request.text)
+
+
+# Checks many texts (documents or paragraphs) in one call. They are fanned out
+# across the LanguageTool workers; results come back in request order.
+@router.post("/correct-batch")
+async def spell_check_batch(request: SpellCheckBatchRequest, priority: Optional[str] = Depends(request_priority)):
+    if len(request.texts) > SPELLCHECK_BATCH_MAX_TEXTS:
+        raise HTTPException(status_code=413, detail=f"At most {SPELLCHECK_BATCH_MAX_TEXTS} texts per batch")
+
+    # Batches are bulk work: low priority unless the client says otherwise
+    cost = estimate_cost(sum(len(text) for text in request.texts))
+    async with admit("cheap", cost, priority or "low"):
+        results = await asyncio.gather(*(check_text_cached(text) for text in request.texts))
+    return {"results": results}
+
+
+async def check_paragraph(text):
+    # Raw matches at offsets within `text`, for incremental sessions
+    async def check():
+        return [
+            {
+                "offset": match.offset,
+                "length": match.errorLength,
+                "error": text[match.offset:match.offset + match.errorLength],
+                "suggestions": match.replacements,
+                "message": match.message,
+            }
+            for match in await pool.check(text)
+        ]
+
+    key = cache_key("spellcheck_paragraph", "languagetool-en-US", text.encode())
+    return await cache.get_or_compute(key, check)
+
+
+# Incremental spellcheck over a WebSocket (see app/spellcheck_session.py).
+#
+# Client messages, each with an optional client "version" echoed back:
+#   {"type": "set", "text": "..."}                                  whole document
+#   {"type": "edit", "edits": [{"offset": 0, "delete": 0, "insert": "..."}]}
+#   {"type": "sync"}                                                all matches
+# Edits are applied in order, offsets in the document as it is after the
+# previous edit. Messages that arrive while a check runs are applied together
+# before the next one. After each round the server sends
+#   {"type": "delta", "version": ..., "removed": [ids], "added": [matches]}
+# and {"type": "matches", ...} for a sync. An invalid edit gets
+# {"type": "error"} and the client should resend the whole text with "set".
+@router.websocket("/session")
+async def spell_check_session(websocket: WebSocket):
+    await websocket.accept()
+    session_opened()
+    document = Document()
+    inbox = asyncio.Queue()
+
+    async def read():
+        while True:
+            try:
+                message = await websocket.receive_json()
+            except WebSocketDisconnect:
+                await inbox.put(None)
+                return
+            except ValueError:
+                message = None
+            await inbox.put(message if isinstance(message, dict) else {"type": "invalid"})
+
+    reader = asyncio.ensure_future(read())
+    try:
+        while True:
+            messages = [await inbox.get()]
+            while not inbox.empty():
+                messages.append(inbox.get_nowait())
+
+            version = None
+            sync = False
+            error = None
+            for message in messages:
+                if message is None:
+                    return
+                version = message.get("version", version)
+                try:
+                    if message.get("type") == "set":
+                        document.set_text(message.get("text", ""))
+                    elif message.get("type") == "edit":
+                        edits = message.get("edits", [])
+                        if not isinstance(edits, list) or not all(isinstance(edit, dict) for edit in edits):
+                            raise EditError("edits must be a list of {offset, delete, insert} objects")
+                        for edit in edits:
+                            document.edit(int(edit.get("offset", 0)), int(edit.get("delete", 0)), edit.get("insert", ""))
+                    elif message.get("type") == "sync":
+                        sync = True
+                    else:
+                        raise EditError(f"Unknown message type {message.get('type')!r}")
+                except (EditError, TypeError, ValueError) as e:
+                    error = str(e)
+            if error:
+                await websocket.send_json({"type": "error", "error": error, "version": version})
+
+            try:
+                async with admit("cheap", estimate_cost(document.pending_chars)):
+                    delta = await document.check(check_paragraph)
+            except HTTPException as e:
+                # Shed: the paragraphs stay pending for the next round
+                await websocket.send_json({"type": "error", "error": e.detail, "version": version,
+                                           "retry_after": (e.headers or {}).get("Retry-After")})
+                continue
+            except Exception as e:
+                await websocket.send_json({"type": "error", "error": str(e), "version": version})
+                continue
+            await websocket.send_json({"type": "delta", "version": version, **delta})
+            if sync:
+                await websocket.send_json({"type": "matches", "version": version, "matches": document.all_matches()})
+    except WebSocketDisconnect:
+        pass
+    finally:
+        reader.cancel()
+        session_closed()
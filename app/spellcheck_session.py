@@ -0,0 +1,161 @@
+import asyncio
+import hashlib
+import itertools
+import os
+
+from app import stats
+
+# Incremental spellcheck documents for the /spellCheck/session WebSocket.
+#
+# A Document is kept as a list of paragraphs (split on "\n"), each with a
+# hash of its text and its LanguageTool matches at paragraph-relative
+# offsets. An edit only re-splits the paragraphs it touches; everything else
+# is left alone, its absolute offsets shifting implicitly with the paragraph
+# starts. The touched paragraphs are replaced, and each check produces a
+# delta: the ids of their old matches and the new matches at absolute
+# offsets. Only text that wasn't seen before goes to LanguageTool: a
+# replacement paragraph whose hash matches one it replaced reuses its results,
+# and the shared result cache covers undo and pasted paragraphs.
+#
+# The client shifts the matches it keeps with the edits it sent, exactly as
+# it shifts its own text: unchanged before the edit, moved by
+# len(insert) - delete after it.
+SPELLCHECK_SESSION_MAX_CHARS = int(os.getenv("SPELLCHECK_SESSION_MAX_CHARS", "1000000"))
+
+_counters = {"sessions": 0, "active": 0, "edits": 0, "paragraphs_checked": 0, "paragraphs_reused": 0}
+stats.register("spellcheck_sessions", lambda: dict(_counters))
+
+
+class EditError(ValueError):
+    pass
+
+
+def _digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode(), digest_size=16).digest()
+
+
+class Paragraph:
+    __slots__ = ("text", "digest", "matches", "known")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.digest = _digest(text)
+        self.matches = None  # None until checked
+        self.known = None  # results of an identical paragraph it replaced
+
+
+class Document:
+    def __init__(self):
+        self.paragraphs = [Paragraph("")]
+        self.length = 0
+        self._dirty = {}  # id(paragraph) -> paragraph, waiting for a check
+        self._removed = []  # match ids dropped since the last delta
+        self._ids = itertools.count(1)
+
+    @property
+    def text(self) -> str:
+        return "\n".join(p.text for p in self.paragraphs)
+
+    def _replace(self, start: int, end: int, texts: list):
+        # Swaps paragraphs[start:end] for new ones holding `texts`. Their
+        # matches are always replaced, since they may have moved differently
+        # from the edit, but known results are not checked again.
+        known = {}
+        for p in self.paragraphs[start:end]:
+            self._dirty.pop(id(p), None)
+            if p.matches is not None:
+                known[p.digest] = [{k: v for k, v in m.items() if k != "id"} for m in p.matches]
+                self._removed.extend(m["id"] for m in p.matches)
+            elif p.known is not None:
+                known[p.digest] = p.known
+        new = []
+        for text in texts:
+            p = Paragraph(text)
+            p.known = known.get(p.digest)
+            self._dirty[id(p)] = p
+            new.append(p)
+        self.paragraphs[start:end] = new
+
+    def set_text(self, text: str):
+        if not isinstance(text, str):
+            raise EditError("text must be a string")
+        if len(text) > SPELLCHECK_SESSION_MAX_CHARS:
+            raise EditError(f"Documents are limited to {SPELLCHECK_SESSION_MAX_CHARS} characters")
+        self._replace(0, len(self.paragraphs), text.split("\n"))
+        self.length = len(text)
+
+    def _locate(self, offset: int, first: int = 0, first_start: int = 0):
+        # (index, start) of the paragraph holding `offset`; an offset at a
+        # paragraph's end (its newline) belongs to that paragraph
+        start = first_start
+        for i in range(first, len(self.paragraphs)):
+            end = start + len(self.paragraphs[i].text)
+            if offset <= end:
+                return i, start
+            start = end + 1
+        raise EditError(f"Offset {offset} is past the end of the document")
+
+    def edit(self, offset: int, delete: int, insert: str):
+        # Replaces text[offset:offset + delete] with `insert`
+        if not isinstance(insert, str):
+            raise EditError("insert must be a string")
+        if offset < 0 or delete < 0 or offset + delete > self.length:
+            raise EditError(f"Edit at {offset} deleting {delete} is outside the document (length {self.length})")
+        if self.length - delete + len(insert) > SPELLCHECK_SESSION_MAX_CHARS:
+            raise EditError(f"Documents are limited to {SPELLCHECK_SESSION_MAX_CHARS} characters")
+        first, first_start = self._locate(offset)
+        last, _ = self._locate(offset + delete, first, first_start)
+        region = "\n".join(p.text for p in self.paragraphs[first:last + 1])
+        local = offset - first_start
+        region = region[:local] + insert + region[local + delete:]
+        self._replace(first, last + 1, region.split("\n"))
+        self.length += len(insert) - delete
+        _counters["edits"] += 1
+
+    @property
+    def pending_chars(self) -> int:
+        # Text that will actually go to LanguageTool in the next check
+        return sum(len(p.text) for p in self._dirty.values() if p.known is None)
+
+    async def check(self, check_paragraph) -> dict:
+        # Checks the paragraphs changed since the last call with
+        # check_paragraph(text) -> [match dicts at paragraph offsets] and
+        # returns the delta. On failure the paragraphs stay pending.
+        pending = list(self._dirty.values())
+        unknown = [p for p in pending if p.known is None and p.text.strip()]
+        results = dict(zip(map(id, unknown), await asyncio.gather(*(check_paragraph(p.text) for p in unknown))))
+        for p in pending:
+            matches = results.get(id(p), p.known or [])
+            p.matches = [{"id": next(self._ids), **match} for match in matches]
+            p.known = None
+        self._dirty.clear()
+        _counters["paragraphs_checked"] += len(unknown)
+        _counters["paragraphs_reused"] += len(pending) - len(unknown)
+
+        checked = {id(p) for p in pending}
+        added = []
+        start = 0
+        if checked:
+            for p in self.paragraphs:
+                if id(p) in checked:
+                    added.extend({**m, "offset": start + m["offset"]} for m in p.matches)
+                start += len(p.text) + 1
+        removed, self._removed = self._removed, []
+        return {"removed": removed, "added": added, "checked_paragraphs": len(unknown)}
+
+    def all_matches(self) -> list:
+        matches = []
+        start = 0
+        for p in self.paragraphs:
+            matches.extend({**m, "offset": start + m["offset"]} for m in p.matches or ())
+            start += len(p.text) + 1
+        return matches
+
+
+def session_opened():
+    _counters["sessions"] += 1
+    _counters["active"] += 1
+
+
+def session_closed():
+    _counters["active"] -= 1
@@ -0,0 +1,16 @@
+from fastapi import APIRouter
+
+router = APIRouter()
+
+# Subsystems register a zero-argument callable returning a JSON-serialisable
+# snapshot of their counters; GET /stats returns all of them in one document.
+_providers = {}
+
+
+def register(name: str, provider):
+    _providers[name] = provider
+
+
+@router.get("")
+async def get_stats():
+    return {name: provider() for name, provider in _providers.items()}
@@ -0,0 +1,51 @@
+import json
+
+from fastapi.responses import StreamingResponse
+
+# Helpers for relaying incremental results to the client, either as
+# Server-Sent Events or as newline-delimited JSON.
+
+STREAM_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # stop nginx from buffering the stream
+}
+
+
+def sse_event(data, event: str = None) -> str:
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+
+async def relay_tokens(tokens, error_types=(Exception,)):
+    # Each token becomes a `data: {"token": ...}` event, followed by a final
+    # `done` event (or an `error` event if the upstream call failed).
+    try:
+        async for token in tokens:
+            yield sse_event({"token": token})
+        yield sse_event({}, event="done")
+    except error_types as e:
+        yield sse_event({"error": str(e)}, event="error")
+    finally:
+        # Runs when the client disconnects too: closing the token source
+        # tears down the upstream request instead of letting it finish.
+        await tokens.aclose()
+
+
+def sse_response(tokens, error_types=(Exception,), background=None) -> StreamingResponse:
+    return StreamingResponse(
+        relay_tokens(tokens, error_types), media_type="text/event-stream", headers=STREAM_HEADERS, background=background
+    )
+
+
+async def relay_ndjson(records):
+    try:
+        async for record in records:
+            yield json.dumps(record) + "\n"
+    finally:
+        await records.aclose()
+
+
+def ndjson_response(records, background=None) -> StreamingResponse:
+    return StreamingResponse(
+        relay_ndjson(records), media_type="application/x-ndjson", headers=STREAM_HEADERS, background=background
+    )
@@ -1,49 +1,164 @@
-from fastapi import FastAPI, APIRouter, File, UploadFile, Form
+from fastapi import APIRouter, Depends, File, UploadFile, Form, HTTPException
 from pydantic import BaseModel
-from transformers import PegasusForConditionalGeneration, PegasusTokenizer
-import nltk
-import docx
-import fitz  # PyMuPDF 
+from typing import Optional
+import asyncio
+import os
+from app.admission import admit, estimate_cost, request_priority
+from app.backends import load_seq2seq
+from app.batching import BatchScheduler, QueueFullError
+from app.cache import ResultCache, cache_key
+from app import extractive
+from app.chunking import chunk_sentences, split_sentences
+from app.extraction import extract_upload_text, ExtractionError
+from app.model_registry import registry
+from app.quality import decoding as quality_decoding, max_input_tokens as quality_input_tokens, resolve as resolve_quality
 
 
-nltk.download('punkt')
+router = APIRouter()
 
 
-app = FastAPI()
-router = APIRouter()
+model_name = os.getenv("SUMMARIZER_MODEL", "google/pegasus-large")
+
+
+def load_model():
+    # transformers is imported here so importing the app stays cheap
+    from transformers import PegasusForConditionalGeneration, PegasusTokenizer
+    return load_seq2seq("summarizer", model_name, PegasusForConditionalGeneration, PegasusTokenizer)
+
+
+registry.register("summarizer", load_model)
+scheduler = BatchScheduler("summarizer")
+cache = ResultCache("summarizer")
+
+# 1 makes every tier greedy, which lets a draft model assist (app/assisted.py)
+SUMMARIZER_NUM_BEAMS = int(os.getenv("SUMMARIZER_NUM_BEAMS", "4"))
+
+# Long-document (map-reduce) mode: inputs over the model's 1024-token window
+# are split into overlapping sentence-aligned chunks, the chunks are
+# summarized together, and the partial summaries are reduced recursively
+# until they fit in one final pass.
+MAX_INPUT_TOKENS = 1024
+LONG_DOC_CHUNK_TOKENS = int(os.getenv("LONG_DOC_CHUNK_TOKENS", "1000"))
+LONG_DOC_OVERLAP_TOKENS = int(os.getenv("LONG_DOC_OVERLAP_TOKENS", "64"))
+LONG_DOC_CHUNK_SUMMARY_TOKENS = int(os.getenv("LONG_DOC_CHUNK_SUMMARY_TOKENS", "128"))
+LONG_DOC_MAX_LEVELS = int(os.getenv("LONG_DOC_MAX_LEVELS", "4"))
+# Documents longer than this many tokens are cut down to their most salient
+# sentences (TextRank, app/extractive.py) before map-reduce; 0 disables it
+LONG_DOC_PREFILTER_TOKENS = int(os.getenv("LONG_DOC_PREFILTER_TOKENS", "8000"))
+
+SUMMARY_MODES = ("abstractive", "extractive")
+
 
+async def token_lengths(sentences):
+    return await scheduler.run_with_tokenizer(
+        lambda tokenizer: [len(ids) for ids in tokenizer(sentences, add_special_tokens=False)["input_ids"]]
+    )
 
-model_name = "google/pegasus-large"
-tokenizer = PegasusTokenizer.from_pretrained(model_name)
-model = PegasusForConditionalGeneration.from_pretrained(model_name)
 
+def summary_kwargs(length, tier):
+    return dict(
+        length_penalty=1.0,
+        early_stopping=True,
+        **quality_decoding(tier, num_beams=SUMMARIZER_NUM_BEAMS, max_length=length, min_length=length // 2)
+    )
 
-def extract_text_from_docx(file):
-    doc = docx.Document(file)
-    return "\n".join([para.text for para in doc.paragraphs])
 
+async def generate_summary(text, length, tier="best", max_input_length=MAX_INPUT_TOKENS):
+    return (await scheduler.submit(text, max_input_length=max_input_length, **summary_kwargs(length, tier)))[0]
 
-def extract_text_from_pdf(file):
-    pdf = fitz.open(stream=file.read(), filetype="pdf")
-    text = ""
-    for page_num in range(len(pdf)):
-        page = pdf.load_page(page_num)
-        text += page.get_text("text")
-    return text
+
+async def summarize_chunks(chunks, length, tier):
+    # Chunks are length-sorted and cut into batches of at most the
+    # scheduler's batch size, each run as one generate call. Returns the
+    # partial summaries in chunk order and the batch sizes that ran.
+    ids = await scheduler.run_with_tokenizer(
+        lambda tokenizer: tokenizer(chunks, truncation=True, max_length=MAX_INPUT_TOKENS)["input_ids"]
+    )
+    order = sorted(range(len(chunks)), key=lambda i: len(ids[i]))
+    size = scheduler.max_batch_size
+    batches = [order[k:k + size] for k in range(0, len(order), size)]
+    kwargs = summary_kwargs(length, tier)
+    outputs = await asyncio.gather(*(scheduler.submit_batch([ids[i] for i in batch], **kwargs) for batch in batches))
+    partials = [None] * len(chunks)
+    for batch, batch_outputs in zip(batches, outputs):
+        for i, output in zip(batch, batch_outputs):
+            partials[i] = output[0]
+    return partials, [len(batch) for batch in batches]
+
+
+async def summarize_document(text: str, length: int, long_document: bool = True, tier: str = "best") -> dict:
+    # Long-document mode already bounds each generate call's input, so the
+    # tier only changes decoding there; single-pass input is truncated too
+    sentences = split_sentences(text)
+    result = {"sentences": len(sentences), "chunks": 1, "batch_size": 1, "batches": 1, "reduce_levels": 0, "quality": tier}
+
+    if long_document and sentences:
+        lengths = await token_lengths(sentences)
+        if LONG_DOC_PREFILTER_TOKENS and sum(lengths) > LONG_DOC_PREFILTER_TOKENS:
+            scores = await asyncio.to_thread(extractive.textrank, sentences)
+            keep = extractive.select(scores, lengths, LONG_DOC_PREFILTER_TOKENS)
+            sentences = [sentences[i] for i in keep]
+            lengths = [lengths[i] for i in keep]
+            text = " ".join(sentences)
+            result["prefiltered"] = len(keep)
+        # Map, then reduce the partial summaries until they fit one window
+        while sum(lengths) > LONG_DOC_CHUNK_TOKENS and result["reduce_levels"] < LONG_DOC_MAX_LEVELS:
+            chunks = chunk_sentences(sentences, lengths, LONG_DOC_CHUNK_TOKENS, LONG_DOC_OVERLAP_TOKENS)
+            partials, batch_sizes = await summarize_chunks(chunks, LONG_DOC_CHUNK_SUMMARY_TOKENS, tier)
+            if result["reduce_levels"] == 0:
+                result["chunks"] = len(chunks)
+                result["batch_size"] = max(batch_sizes)
+                result["batches"] = len(batch_sizes)
+            result["reduce_levels"] += 1
+
+            text = " ".join(partials)
+            sentences = split_sentences(text)
+            lengths = await token_lengths(sentences)
+
+    max_input_length = MAX_INPUT_TOKENS if long_document else quality_input_tokens(tier, MAX_INPUT_TOKENS)
+    result["summary"] = await generate_summary(text, length, tier, max_input_length)
+    return result
 
 
 @router.post("/summarize")
-async def summarize(length: int = Form(...), text: str = Form(None), file: UploadFile = File(None)):
+async def summarize(length: int = Form(...), text: str = Form(None), file: UploadFile = File(None), long_document: bool = Form(True),
+                    quality: Optional[str] = Form(None), mode: str = Form("abstractive"),
+                    priority: Optional[str] = Depends(request_priority)):
+    # Uploads are estimated from their size; a PDF or DOCX holds far fewer
+    # characters of text than bytes
+    if mode not in SUMMARY_MODES:
+        raise HTTPException(status_code=400, detail="mode must be 'abstractive' or 'extractive'")
+    input_chars = len(text) if text else (getattr(file, "size", None) or 0) // 4 if file else 0
+    if mode == "extractive":
+        # No model involved: CPU-cheap, so it shares the cheap class
+        async with admit("cheap", estimate_cost(input_chars), priority):
+            return await summarize_request(length, text, file, long_document, mode="extractive")
+
+    # The models never see more than the pre-filter keeps (long-document
+    # mode) or one window, so neither does the cost
+    if long_document and LONG_DOC_PREFILTER_TOKENS:
+        input_chars = min(input_chars, LONG_DOC_PREFILTER_TOKENS * 4)
+    elif not long_document:
+        input_chars = min(input_chars, MAX_INPUT_TOKENS * 4)
+    tier = resolve_quality(quality, scheduler)
+    decoding = quality_decoding(tier, num_beams=SUMMARIZER_NUM_BEAMS, max_length=length)
+    cost = estimate_cost(input_chars, output_tokens=decoding["max_length"], num_beams=decoding["num_beams"])
+    async with admit("heavy", cost, priority):
+        return await summarize_request(length, text, file, long_document, tier)
+
+
+async def summarize_request(length: int, text: str, file: UploadFile, long_document: bool, tier: str = "best",
+                            mode: str = "abstractive"):
     extracted_text = ""
 
    
-    if file:
-        if file.filename.endswith(".docx"):
-            extracted_text = extract_text_from_docx(file.file)
-        elif file.filename.endswith(".pdf"):
-            extracted_text = extract_text_from_pdf(file.file)
-        else:
-            return {"error": "Unsupported file type. Please upload a .docx or .pdf file."}
+    if file and not text:
+        try:
+            extracted_text = await extract_upload_text(file)
+        except ExtractionError as e:
+            if e.status_code == 400:
+                return {"error": str(e)}
+            raise HTTPException(status_code=e.status_code, detail=str(e))
 
     
     if text:
@@ -54,32 +169,40 @@ async def summarize(length: int = Form(...), text: str = Form(None), file: Uploa
         return {"error": "No valid text or file provided."}
 
  
-    inputs = tokenizer(extracted_text, return_tensors="pt", max_length=1024, truncation=True)
+    if mode == "extractive":
+        return await extractive_summary(extracted_text, length)
 
-    summary_ids = model.generate(
-        inputs["input_ids"],
-        max_length=length,  
-        min_length=length // 2,  
-        length_penalty=1.0,
-        num_beams=4,
-        early_stopping=True
-    )
-
-    summary = tokenizer.decode(summary_ids[0], skip_special_tokens=True)
+    key = cache_key("summarize", model_name, extracted_text, length=length, long_document=long_document, quality=tier)
+    try:
+        result = await cache.get_or_compute(key, lambda: summarize_document(extracted_text, length, long_document, tier))
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
 
+    summary = result["summary"]
   
     word_count = len(extracted_text.split())
-    sentence_count = len(nltk.sent_tokenize(extracted_text))
+    sentence_count = result["sentences"]
     summary_word_count = len(summary.split())
 
     
     stats = f"Input Text - Words: {word_count}, Sentences: {sentence_count}\n"
     stats += f"Summary - Words: {summary_word_count}"
+    if result["reduce_levels"]:
+        stats += f"\nLong Document - Chunks: {result['chunks']}, Batch Size: {result['batch_size']}, "
+        stats += f"Batches: {result['batches']}, Reduce Levels: {result['reduce_levels']}"
+    if "prefiltered" in result:
+        stats += f"\nPre-filter - Kept Sentences: {result['prefiltered']} of {sentence_count}"
 
-    return {"summary": summary, "stats": stats}
-
-app.include_router(router, prefix="/summarizer", tags=["Text Summarizer"])
-
+    return {"summary": summary, "stats": stats, "quality": tier, "mode": "abstractive"}
 
 
+async def extractive_summary(text: str, length: int):
+    # `length` is the abstractive token limit; about 3/4 of a word per token
+    def run():
+        return extractive.summarize(split_sentences(text), max_words=max(1, length * 3 // 4))
 
+    key = cache_key("summarize_extractive", "textrank", text, length=length)
+    result = await cache.get_or_compute(key, lambda: asyncio.to_thread(run))
+    stats = f"Input Text - Words: {len(text.split())}, Sentences: {result['sentences']}\n"
+    stats += f"Summary - Words: {len(result['summary'].split())}, Selected Sentences: {result['selected']}"
+    return {"summary": result["summary"], "stats": stats, "mode": "extractive"}
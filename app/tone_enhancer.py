@@ -1,26 +1,14 @@
-from fastapi import APIRouter, FastAPI
+from fastapi import APIRouter, Depends
 from pydantic import BaseModel
+from typing import Optional
+from starlette.background import BackgroundTask
 import json
-import requests
-import os
-from dotenv import load_dotenv
-from fastapi.middleware.cors import CORSMiddleware
+from app.admission import acquire, admit, release_after, request_priority
+from app.groq_client import chat_completion, stream_chat_completion, UpstreamError
+from app.streaming import sse_response
 
-# Load environment variables from the .env file
-load_dotenv()
-
-app = FastAPI()
 router = APIRouter()
 
-# CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # Allow all origins temporarily for debugging
-    allow_credentials=True,
-    allow_methods=["*"],  # Allow all HTTP methods
-    allow_headers=["*"],  # Allow all headers
-)
-
 # Define a data model for the request body
 class ToneEnhanceRequest(BaseModel):
     text: str
@@ -53,72 +41,68 @@ def create_rephrase_prompt(text):
     """
     return template.strip()
 
+def create_tone_enhance_messages(text, tone):
+    return [
+        {
+            "role": "system",
+            "content": "You are a tone enhancement assistant."
+        },
+        {
+            "role": "user",
+            "content": create_tone_enhance_prompt(text, tone)
+        }
+    ]
+
+def create_rephrase_messages(text):
+    return [
+        {
+            "role": "system",
+            "content": "You are a rephrasing assistant."
+        },
+        {
+            "role": "user",
+            "content": create_rephrase_prompt(text)
+        }
+    ]
+
 # Define endpoint for tone enhancement
 @router.post("/enhance_tone")
-async def enhance_tone(request: ToneEnhanceRequest):
-    url = "https://api.groq.com/openai/v1/chat/completions"  # Groq API endpoint
-    headers = {
-        "Authorization": f"Bearer {os.getenv('GROQ_API_KEY')}",  # Use the API key from the .env file
-        "Content-Type": "application/json"
-    }
-
-    prompt = create_tone_enhance_prompt(request.text, request.tone)
-    data = {
-        "model": "llama-3.1-8b-instant",  # Specify the Groq model you want to use
-        "messages": [
-            {
-                "role": "system",
-                "content": "You are a tone enhancement assistant."
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        "max_tokens": 4096
-    }
+async def enhance_tone(request: ToneEnhanceRequest, priority: Optional[str] = Depends(request_priority)):
+    messages = create_tone_enhance_messages(request.text, request.tone)
 
     try:
-        response = requests.post(url, headers=headers, json=data)  # Use json parameter to send data
-        response.raise_for_status()
-        enhanced_text = response.json()
-    except requests.exceptions.RequestException as e:
+        async with admit("llm", priority=priority):
+            enhanced_text = await chat_completion(messages, max_tokens=4096)
+    except UpstreamError as e:
         return {"error": f"Request failed: {str(e)}"}
 
-    return {"enhanced_text": enhanced_text["choices"][0]["message"]["content"]}  # Extract enhanced text content
+    return {"enhanced_text": enhanced_text}
 
 # Define endpoint for rephrasing text
 @router.post("/rephrase")
-async def rephrase_text(request: RephraseRequest):
-    url = "https://api.groq.com/openai/v1/chat/completions"  # Groq API endpoint
-    headers = {
-        "Authorization": f"Bearer {os.getenv('GROQ_API_KEY')}",  # Use the API key from the .env file
-        "Content-Type": "application/json"
-    }
-
-    prompt = create_rephrase_prompt(request.text)
-    data = {
-        "model": "llama-3.1-8b-instant",  # Specify the Groq model you want to use
-        "messages": [
-            {
-                "role": "system",
-                "content": "You are a rephrasing assistant."
-            },
-            {
-                "role": "user",
-                "content": prompt
-            }
-        ],
-        "max_tokens": 4096
-    }
+async def rephrase_text(request: RephraseRequest, priority: Optional[str] = Depends(request_priority)):
+    messages = create_rephrase_messages(request.text)
 
     try:
-        response = requests.post(url, headers=headers, json=data)  # Use json parameter to send data
-        response.raise_for_status()
-        rephrased_text = response.json()
-    except requests.exceptions.RequestException as e:
+        async with admit("llm", priority=priority):
+            rephrased_text = await chat_completion(messages, max_tokens=4096)
+    except UpstreamError as e:
         return {"error": f"Request failed: {str(e)}"}
 
-    return {"rephrased_text": rephrased_text["choices"][0]["message"]["content"]}  # Extract rephrased text content
+    return {"rephrased_text": rephrased_text}
+
+# Streaming variants: relay tokens as Server-Sent Events as they are generated
+@router.post("/enhance_tone/stream")
+async def enhance_tone_stream(request: ToneEnhanceRequest, priority: Optional[str] = Depends(request_priority)):
+    messages = create_tone_enhance_messages(request.text, request.tone)
+    ticket = await acquire("llm", priority=priority)
+    tokens = release_after(ticket, stream_chat_completion(messages, max_tokens=4096))
+    return sse_response(tokens, error_types=(UpstreamError,), background=BackgroundTask(ticket.release))
+
+@router.post("/rephrase/stream")
+async def rephrase_text_stream(request: RephraseRequest, priority: Optional[str] = Depends(request_priority)):
+    messages = create_rephrase_messages(request.text)
+    ticket = await acquire("llm", priority=priority)
+    tokens = release_after(ticket, stream_chat_completion(messages, max_tokens=4096))
+    return sse_response(tokens, error_types=(UpstreamError,), background=BackgroundTask(ticket.release))
 
-app.include_router(router, prefix="/tone", tags=["Tone enhancer"])
@@ -0,0 +1,109 @@
+"""Compare assisted (draft model) decoding with plain generate.
+
+    python -m benchmarks.bench_assisted --model google/pegasus-large --draft sshleifer/distill-pegasus-cnn-16-4
+
+Summarizes every document of the local corpus greedily, once with plain
+`model.generate` and once with the draft model assisting, one document at a
+time as the scheduler does for small batches. It reports generated tokens
+per second for both, the speedup, the draft acceptance rate, and how many
+outputs are identical (greedy assisted decoding should match plain greedy
+exactly; ROUGE against the plain output shows how far any mismatch goes).
+`--baseline-beams 4` also times plain beam search, the summarizer's default.
+"""
+import argparse
+import json
+import time
+
+import torch
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+from app.assisted import ASSISTED_MIN_ACCEPTANCE, _ForwardCounter
+from app.backends import load_seq2seq
+from benchmarks.compare_backends import DEFAULT_CORPUS, mean_rouge
+
+
+def run(tokenizer, model, texts, generate_kwargs, draft=None):
+    outputs, seconds, tokens = [], 0.0, 0
+    accepted = proposed = 0
+    for text in texts:
+        input_ids = torch.tensor([tokenizer(text, truncation=True, max_length=1024)["input_ids"]])
+        counters = (_ForwardCounter(model), _ForwardCounter(draft)) if draft is not None else None
+        started = time.perf_counter()
+        with torch.inference_mode():
+            if draft is not None:
+                output_ids = model.generate(input_ids=input_ids, assistant_model=draft, **generate_kwargs)
+            else:
+                output_ids = model.generate(input_ids=input_ids, **generate_kwargs)
+        seconds += time.perf_counter() - started
+        generated = int((output_ids[0] != tokenizer.pad_token_id).sum())
+        tokens += generated
+        if counters:
+            target, assistant = counters
+            target.remove()
+            assistant.remove()
+            accepted += max(generated - target.count, 0)
+            proposed += assistant.count
+        outputs.append(tokenizer.decode(output_ids[0], skip_special_tokens=True))
+    result = {"outputs": outputs, "seconds": seconds, "tokens": tokens, "tokens_per_s": tokens / seconds}
+    if draft is not None:
+        result["acceptance"] = accepted / proposed if proposed else 0.0
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="google/pegasus-large")
+    parser.add_argument("--draft", required=True, help="draft checkpoint sharing the model's vocabulary")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--max-length", type=int, default=128)
+    parser.add_argument("--baseline-beams", type=int, default=1, help="also time plain beam search with this width")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    with open(args.corpus) as f:
+        texts = [doc["text"] for doc in json.load(f)]
+
+    tokenizer, model = load_seq2seq("bench", args.model, AutoModelForSeq2SeqLM, AutoTokenizer, backend="eager")
+    _, draft = load_seq2seq("bench_draft", args.draft, AutoModelForSeq2SeqLM, AutoTokenizer, backend="eager")
+    greedy = dict(num_beams=1, do_sample=False, max_length=args.max_length)
+
+    run(tokenizer, model, texts[:1], greedy, draft)  # warm-up
+    plain = run(tokenizer, model, texts, greedy)
+    assisted = run(tokenizer, model, texts, greedy, draft)
+
+    report = {
+        "model": args.model,
+        "draft": args.draft,
+        "documents": len(texts),
+        "plain_tokens_per_s": round(plain["tokens_per_s"], 2),
+        "assisted_tokens_per_s": round(assisted["tokens_per_s"], 2),
+        "speedup": round(plain["seconds"] / assisted["seconds"], 2),
+        "acceptance": round(assisted["acceptance"], 3),
+        "min_acceptance": ASSISTED_MIN_ACCEPTANCE,
+        "exact_match": sum(a == b for a, b in zip(assisted["outputs"], plain["outputs"])),
+        "drift_vs_plain": mean_rouge(zip(assisted["outputs"], plain["outputs"])),
+    }
+    if args.baseline_beams > 1:
+        beams = run(tokenizer, model, texts, dict(num_beams=args.baseline_beams, max_length=args.max_length, early_stopping=True))
+        report["beam_search"] = {
+            "num_beams": args.baseline_beams,
+            "tokens_per_s": round(beams["tokens_per_s"], 2),
+            "assisted_speedup": round(beams["seconds"] / assisted["seconds"], 2),
+            "drift_vs_assisted": mean_rouge(zip(assisted["outputs"], beams["outputs"])),
+        }
+
+    print(f"plain     {report['plain_tokens_per_s']:8.2f} tok/s")
+    print(f"assisted  {report['assisted_tokens_per_s']:8.2f} tok/s  speedup {report['speedup']:.2f}x  "
+          f"acceptance {report['acceptance']:.2f} (fallback below {ASSISTED_MIN_ACCEPTANCE})")
+    print(f"identical outputs {report['exact_match']}/{len(texts)}, ROUGE-L vs plain {report['drift_vs_plain']['rougeL']:.4f}")
+    if "beam_search" in report:
+        entry = report["beam_search"]
+        print(f"beams={entry['num_beams']}  {entry['tokens_per_s']:8.2f} tok/s  assisted is {entry['assisted_speedup']:.2f}x faster")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Time the extractive (TextRank) summarizer on a long synthetic document.
+
+    python -m benchmarks.bench_extractive [--pages 100] [--runs 3] [--max-seconds 1.0] [--output extractive.json]
+
+Builds a document of --pages pages (about 500 words each) by shuffling the
+sentences of the local corpus, then times sentence splitting, TF-IDF and
+TextRank scoring, and selection separately (best of --runs). With
+--max-seconds it exits non-zero when a full extractive summary takes longer.
+"""
+import argparse
+import json
+import random
+import time
+
+from app import extractive
+from app.chunking import split_sentences
+from benchmarks.compare_backends import DEFAULT_CORPUS
+
+WORDS_PER_PAGE = 500
+
+
+def build_document(corpus_path, pages, seed=0):
+    with open(corpus_path) as f:
+        sentences = [s for doc in json.load(f) for s in split_sentences(doc["text"])]
+    rng = random.Random(seed)
+    document, words = [], 0
+    while words < pages * WORDS_PER_PAGE:
+        sentence = rng.choice(sentences)
+        # Vary the wording a little so sentences aren't exact duplicates
+        document.append(sentence.replace(".", f" (section {len(document) % 97}).", 1) if rng.random() < 0.3 else sentence)
+        words += len(sentence.split())
+    return " ".join(document)
+
+
+def time_once(text, max_words):
+    timings = {}
+    started = time.perf_counter()
+    sentences = split_sentences(text)
+    timings["split"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    scores = extractive.textrank(sentences)
+    timings["textrank"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    chosen = extractive.select(scores, [len(s.split()) for s in sentences], max_words)
+    timings["select"] = time.perf_counter() - started
+
+    timings["total"] = sum(timings.values())
+    return timings, len(sentences), len(chosen)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=100)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--max-words", type=int, default=250)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--max-seconds", type=float, help="fail if the best full run is slower than this")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    text = build_document(args.corpus, args.pages)
+    runs = [time_once(text, args.max_words) for _ in range(args.runs)]
+    best, sentences, selected = min(runs, key=lambda run: run[0]["total"])
+
+    report = {
+        "pages": args.pages,
+        "words": len(text.split()),
+        "sentences": sentences,
+        "selected": selected,
+        "best_ms": {stage: round(seconds * 1000, 1) for stage, seconds in best.items()},
+    }
+    print(f"{args.pages} pages, {report['words']} words, {sentences} sentences -> {selected} selected")
+    for stage, ms in report["best_ms"].items():
+        print(f"{stage:>9} {ms:9.1f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.max_seconds is not None and best["total"] > args.max_seconds:
+        raise SystemExit(f"extractive summary took {best['total']:.3f}s, limit {args.max_seconds}s")
+
+
+if __name__ == "__main__":
+    main()
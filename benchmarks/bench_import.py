@@ -0,0 +1,79 @@
+"""Measure how long `import main` takes in a fresh interpreter.
+
+    python -m benchmarks.bench_import [--runs 3] [--top 15] [--max-seconds 2.0] [--output import.json]
+
+Runs `python -X importtime -c "import main"` in a subprocess, reports the
+wall time (best of --runs) and the modules with the largest cumulative
+import time. With --max-seconds it exits non-zero when the best run is
+slower, so an accidental top-level `import torch` shows up in CI.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def import_once():
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    seconds = time.perf_counter() - started
+    if result.returncode != 0:
+        sys.exit(f"`import main` failed:\n{result.stderr[-2000:]}")
+    return seconds, parse_importtime(result.stderr)
+
+
+def parse_importtime(output):
+    # Lines look like "import time:  self [us] | cumulative | imported package"
+    modules = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, self_us, cumulative_us, name = (part.strip() for part in line.replace("import time:", "|", 1).split("|"))
+        modules[name] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--max-seconds", type=float, help="fail if the best run is slower than this")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    runs = [import_once() for _ in range(args.runs)]
+    best_seconds, modules = min(runs, key=lambda run: run[0])
+    top = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+    heavy = [name for name in ("torch", "transformers", "fitz", "docx", "google.generativeai", "nltk") if name in modules]
+
+    print(f"import main: best {best_seconds:.3f}s over {args.runs} runs ({len(modules)} modules)")
+    print(f"{'cumulative (ms)':>16} {'self (ms)':>10}  module")
+    for name, (self_us, cumulative_us) in top:
+        print(f"{cumulative_us / 1000:16.1f} {self_us / 1000:10.1f}  {name}")
+    if heavy:
+        print(f"heavy modules imported at startup: {', '.join(heavy)}")
+
+    if args.output:
+        report = {
+            "best_seconds": round(best_seconds, 4),
+            "runs_seconds": [round(seconds, 4) for seconds, _ in runs],
+            "modules": len(modules),
+            "heavy_modules": heavy,
+            "top": [{"module": name, "cumulative_ms": c / 1000, "self_ms": s / 1000} for name, (s, c) in top],
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.max_seconds is not None and best_seconds > args.max_seconds:
+        sys.exit(f"import took {best_seconds:.3f}s, over the {args.max_seconds:g}s limit")
+
+
+if __name__ == "__main__":
+    main()
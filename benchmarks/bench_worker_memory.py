@@ -0,0 +1,121 @@
+"""Check that memory stays flat as prefork workers are added.
+
+    python -m benchmarks.bench_worker_memory [--workers 1 2 4] [--shared-models summarizer] [--max-growth-mb 300]
+
+For each worker count it starts `python -m app.serve`, waits for /readyz,
+then reads /proc/<pid>/smaps_rollup for the parent and every worker. PSS
+splits shared pages between the processes that map them, so the total PSS
+is the real footprint: with shared weights it grows by roughly one
+interpreter per worker, not one model copy. USS (private pages) per worker
+is what each extra worker costs. With --max-growth-mb the script exits
+non-zero when an extra worker adds more than that to the total PSS.
+Linux only.
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def memory_kb(pid):
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def children_of(pid):
+    children = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        with open(f"/proc/{pid}/task/{task}/children") as f:
+            children.extend(int(child) for child in f.read().split())
+    return children
+
+
+def wait_ready(port, workers, timeout):
+    # Every worker warms up on its own; poll until several answers in a row are ready
+    deadline = time.monotonic() + timeout
+    ready_in_a_row = 0
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/readyz", timeout=5) as response:
+                ready_in_a_row = ready_in_a_row + 1 if response.status == 200 else 0
+        except (urllib.error.URLError, ConnectionError):
+            ready_in_a_row = 0
+        if ready_in_a_row >= 3 * workers:
+            return
+        time.sleep(0.2)
+    raise TimeoutError(f"server not ready after {timeout:g}s")
+
+
+def measure(workers, shared_models, port, timeout):
+    command = [sys.executable, "-m", "app.serve", "--workers", str(workers), "--port", str(port),
+               "--shared-models", shared_models, "--log-level", "warning"]
+    server = subprocess.Popen(command, cwd=ROOT)
+    try:
+        wait_ready(port, workers, timeout)
+        time.sleep(1)
+        parent = memory_kb(server.pid)
+        worker_pids = children_of(server.pid)
+        worker_memory = [memory_kb(pid) for pid in worker_pids]
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+    total_pss = parent["pss"] + sum(m["pss"] for m in worker_memory)
+    return {
+        "workers": workers,
+        "parent": parent,
+        "worker_pids": len(worker_pids),
+        "mean_worker_uss_mb": round(sum(m["uss"] for m in worker_memory) / max(len(worker_memory), 1) / 1024, 1),
+        "mean_worker_rss_mb": round(sum(m["rss"] for m in worker_memory) / max(len(worker_memory), 1) / 1024, 1),
+        "total_pss_mb": round(total_pss / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--shared-models", default="summarizer")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--max-growth-mb", type=float, help="fail if one extra worker adds more total PSS than this")
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    results = [measure(n, args.shared_models, args.port, args.timeout) for n in args.workers]
+
+    print(f"{'workers':>7} {'total PSS (MB)':>15} {'worker USS (MB)':>16} {'worker RSS (MB)':>16}")
+    for r in results:
+        print(f"{r['workers']:>7} {r['total_pss_mb']:15.1f} {r['mean_worker_uss_mb']:16.1f} {r['mean_worker_rss_mb']:16.1f}")
+
+    growth = []
+    for previous, current in zip(results, results[1:]):
+        added = current["workers"] - previous["workers"]
+        growth.append((current["total_pss_mb"] - previous["total_pss_mb"]) / added)
+    if growth:
+        print(f"total PSS per extra worker: {max(growth):.1f} MB (worst case)")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"shared_models": args.shared_models, "results": results, "pss_per_extra_worker_mb": growth}, f, indent=2)
+
+    if args.max_growth_mb is not None and growth and max(growth) > args.max_growth_mb:
+        sys.exit(f"an extra worker added {max(growth):.1f} MB, over the {args.max_growth_mb:g} MB limit")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Compare inference backends on quality drift and latency.
+
+    python -m benchmarks.compare_backends --model facebook/bart-large-cnn --backends eager int8 onnx
+
+Summarizes every document of a fixed local corpus with each backend. It
+reports mean latency, speedup over eager fp32, and ROUGE-1/2/L F1 of each
+backend's output against the eager output (drift), plus against the
+corpus reference summaries where present. The ONNX backend needs an export
+from `python -m app.backends convert <model>` first.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import time
+
+from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+from app.backends import BACKENDS, load_seq2seq
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "data", "corpus.json")
+
+_word = re.compile(r"\w+")
+
+
+def _tokens(text):
+    return _word.findall(text.lower())
+
+
+def _f1(overlap, candidate_total, reference_total):
+    if not overlap:
+        return 0.0
+    precision = overlap / candidate_total
+    recall = overlap / reference_total
+    return 2 * precision * recall / (precision + recall)
+
+
+def _ngram_f1(candidate, reference, n):
+    def ngrams(tokens):
+        counts = {}
+        for i in range(len(tokens) - n + 1):
+            gram = tuple(tokens[i:i + n])
+            counts[gram] = counts.get(gram, 0) + 1
+        return counts
+
+    c, r = ngrams(candidate), ngrams(reference)
+    overlap = sum(min(count, r.get(gram, 0)) for gram, count in c.items())
+    return _f1(overlap, sum(c.values()), sum(r.values()))
+
+
+def _lcs_f1(candidate, reference):
+    previous = [0] * (len(reference) + 1)
+    for a in candidate:
+        current = [0]
+        for j, b in enumerate(reference):
+            current.append(previous[j] + 1 if a == b else max(previous[j + 1], current[j]))
+        previous = current
+    return _f1(previous[-1], len(candidate), len(reference))
+
+
+def rouge(candidate: str, reference: str) -> dict:
+    c, r = _tokens(candidate), _tokens(reference)
+    return {"rouge1": _ngram_f1(c, r, 1), "rouge2": _ngram_f1(c, r, 2), "rougeL": _lcs_f1(c, r)}
+
+
+def mean_rouge(pairs):
+    scores = [rouge(candidate, reference) for candidate, reference in pairs]
+    return {metric: round(statistics.mean(s[metric] for s in scores), 4) for metric in ("rouge1", "rouge2", "rougeL")}
+
+
+def run_backend(backend, model_name, texts, generate_kwargs):
+    tokenizer, model = load_seq2seq("compare", model_name, AutoModelForSeq2SeqLM, AutoTokenizer, backend=backend)
+
+    def summarize(text):
+        inputs = tokenizer(text, return_tensors="pt", truncation=True, max_length=1024)
+        output_ids = model.generate(**inputs, **generate_kwargs)
+        return tokenizer.decode(output_ids[0], skip_special_tokens=True)
+
+    summarize(texts[0])  # warm-up
+    outputs, latencies = [], []
+    for text in texts:
+        started = time.perf_counter()
+        outputs.append(summarize(text))
+        latencies.append(time.perf_counter() - started)
+    return outputs, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="facebook/bart-large-cnn")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--num-beams", type=int, default=4)
+    parser.add_argument("--max-length", type=int, default=80)
+    parser.add_argument("--output", help="write the report as JSON to this file")
+    args = parser.parse_args()
+
+    with open(args.corpus) as f:
+        corpus = json.load(f)
+    texts = [doc["text"] for doc in corpus]
+    references = [doc.get("reference") for doc in corpus]
+    generate_kwargs = dict(num_beams=args.num_beams, max_length=args.max_length, early_stopping=True)
+
+    backends = ["eager"] + [b for b in args.backends if b != "eager"]
+    results = {}
+    for backend in backends:
+        outputs, latencies = run_backend(backend, args.model, texts, generate_kwargs)
+        results[backend] = {"outputs": outputs, "mean_latency_s": statistics.mean(latencies)}
+
+    baseline = results["eager"]
+    report = {"model": args.model, "documents": len(texts), "generate_kwargs": generate_kwargs, "backends": {}}
+    for backend in backends:
+        result = results[backend]
+        entry = {
+            "mean_latency_s": round(result["mean_latency_s"], 4),
+            "speedup": round(baseline["mean_latency_s"] / result["mean_latency_s"], 2),
+            "drift_vs_eager": mean_rouge(zip(result["outputs"], baseline["outputs"])),
+            "exact_match_vs_eager": sum(a == b for a, b in zip(result["outputs"], baseline["outputs"])),
+        }
+        with_reference = [(out, ref) for out, ref in zip(result["outputs"], references) if ref]
+        if with_reference:
+            entry["rouge_vs_reference"] = mean_rouge(with_reference)
+        report["backends"][backend] = entry
+
+    print(f"{'backend':<8} {'latency (s)':>12} {'speedup':>8} {'R1 drift':>9} {'RL drift':>9} {'exact':>6}")
+    for backend, entry in report["backends"].items():
+        drift = entry["drift_vs_eager"]
+        print(f"{backend:<8} {entry['mean_latency_s']:12.3f} {entry['speedup']:8.2f} "
+              f"{drift['rouge1']:9.4f} {drift['rougeL']:9.4f} {entry['exact_match_vs_eager']:>3}/{len(texts)}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""Offline load test for every endpoint.
+
+    python -m benchmarks.loadtest run [--routes email summarizer ...] [--concurrency 8] [--requests 200] [--output run.json]
+    python -m benchmarks.loadtest compare baseline.json run.json [--threshold 0.10]
+
+`run` starts the Groq stub (benchmarks/stub_groq.py) and the app with Gemini
+stubbed out (benchmarks/loadtest_server.py), pointed at tiny local
+checkpoints for the Pegasus/BART paths. It then drives each route at a fixed
+concurrency. Every route gets a few unmeasured warm-up requests first (this
+is where models load), and each request carries a unique suffix so the
+result caches don't answer it, unless --allow-cache is given. The report has
+p50/p95/p99 and mean latency, requests per second, error count and the
+server's peak RSS for each route, plus the server's overall peak RSS.
+
+`compare` prints per-route changes between two reports. It exits non-zero
+when a p95 latency or RPS regresses by more than --threshold.
+
+The tiny checkpoints must be fetched once, like the real ones:
+
+    python -m app.resources fetch --skip-languagetool --models \\
+        hf-internal-testing/tiny-random-PegasusForConditionalGeneration \\
+        hf-internal-testing/tiny-random-BartForConditionalGeneration
+
+The spellcheck route uses the local LanguageTool servers, which need Java.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TINY_PEGASUS = "hf-internal-testing/tiny-random-PegasusForConditionalGeneration"
+TINY_BART = "hf-internal-testing/tiny-random-BartForConditionalGeneration"
+
+TEXT = (
+    "The committee met on Tuesday to review the quarterly budget. Several members raised concerns about "
+    "rising operating costs, while others argued that the new investments would pay off within two years. "
+    "After a long discussion the committee agreed to postpone the final vote until the next meeting."
+)
+ABSTRACT = (
+    "We study the effect of batch size on the convergence of stochastic gradient descent for transformer "
+    "language models and show that a linear warm-up removes most of the instability at large batch sizes."
+)
+
+
+def _email(i):
+    return {"email_length": "short", "tone": "formal", "purpose": f"a project update #{i}",
+            "recipient_name": "Alex", "sender_name": "Sam", "important_keywords": ["deadline", "budget"]}
+
+
+def _papers(i):
+    return {"topic": f"optimization #{i}", "num_papers": 4, "papers": [
+        {"title": f"Paper {i}.{n}", "authors": "A. Author", "year": 2020 + n, "abstract": f"{ABSTRACT} ({i}.{n})"}
+        for n in range(4)
+    ]}
+
+
+# name -> (path, "json" or "form", payload for request number i)
+ROUTES = {
+    "email": ("/email/generate", "json", _email),
+    "tone.enhance": ("/tone/enhance_tone", "json", lambda i: {"text": f"{TEXT} #{i}", "tone": "friendly"}),
+    "tone.rephrase": ("/tone/rephrase", "json", lambda i: {"text": f"{TEXT} #{i}"}),
+    "spellcheck": ("/spellCheck/correct-text", "json", lambda i: {"text": f"Ths sentense has speling erors #{i}."}),
+    "summarizer": ("/summarizer/summarize", "form", lambda i: {"length": "60", "text": f"{TEXT} #{i}"}),
+    "paraphraser": ("/paraphraser/paraphrase", "json",
+                    lambda i: {"text": f"{TEXT.split('.')[0]} #{i}.", "num_paraphrases": 3, "num_beams": 3}),
+    "lit": ("/lit/api/fetch-summarized-papers", "json", _papers),
+    "image": ("/image-to-text/text-to-image", "form", None),  # payload needs the stub URL, see run()
+}
+
+
+def rss_kb(pid, field="VmRSS"):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    k = (len(ordered) - 1) * q
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def _start(command, env):
+    # Logs go to a temp file rather than a pipe nobody drains
+    log = tempfile.TemporaryFile()
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=log)
+    process.log = log
+    return process
+
+
+async def _wait_healthy(client, url, process, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            process.log.seek(0)
+            sys.exit(f"{url} exited during startup:\n{process.log.read().decode()[-2000:]}")
+        try:
+            if (await client.get(url)).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    sys.exit(f"{url} did not come up within {timeout}s")
+
+
+async def _request(client, base_url, route, i, payload_for):
+    path, kind, payload = ROUTES[route]
+    body = (payload_for or payload)(i)
+    started = time.perf_counter()
+    if kind == "json":
+        response = await client.post(base_url + path, json=body)
+    else:
+        response = await client.post(base_url + path, data=body)
+    elapsed = time.perf_counter() - started
+    ok = response.status_code < 400
+    if ok and response.headers.get("content-type", "").startswith("application/json"):
+        data = response.json()
+        ok = not (isinstance(data, dict) and "error" in data)
+    return elapsed, ok
+
+
+async def drive(client, base_url, route, server_pid, concurrency, requests, warmup, payload_for, unique):
+    counter = iter(range(10 ** 9))
+
+    def next_index():
+        return next(counter) if unique else 0
+
+    for _ in range(warmup):
+        await _request(client, base_url, route, next_index(), payload_for)
+
+    latencies, errors = [], 0
+    peak_rss = rss_kb(server_pid)
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            try:
+                elapsed, ok = await _request(client, base_url, route, next_index(), payload_for)
+            except httpx.HTTPError:
+                errors += 1
+                continue
+            latencies.append(elapsed)
+            errors += not ok
+
+    async def sample_rss():
+        nonlocal peak_rss
+        while True:
+            peak_rss = max(peak_rss, rss_kb(server_pid))
+            await asyncio.sleep(0.1)
+
+    sampler = asyncio.ensure_future(sample_rss())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+    sampler.cancel()
+
+    ms = [seconds * 1000 for seconds in latencies]
+    return {
+        "requests": requests,
+        "errors": errors,
+        "concurrency": concurrency,
+        "rps": round(len(latencies) / wall, 2) if wall else None,
+        "p50_ms": round(percentile(ms, 0.50), 2) if ms else None,
+        "p95_ms": round(percentile(ms, 0.95), 2) if ms else None,
+        "p99_ms": round(percentile(ms, 0.99), 2) if ms else None,
+        "mean_ms": round(statistics.mean(ms), 2) if ms else None,
+        "peak_rss_mb": round(peak_rss / 1024, 1),
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+async def run(args):
+    env = dict(os.environ)
+    env.setdefault("SUMMARIZER_MODEL", TINY_PEGASUS)
+    env.setdefault("PARAPHRASER_MODEL", TINY_PEGASUS)
+    env.setdefault("LIT_REVIEW_MODEL", TINY_BART)
+    env.setdefault("STUB_LATENCY_MS", str(args.upstream_latency_ms))
+    env.setdefault("STUB_GEMINI_LATENCY_MS", str(args.upstream_latency_ms))
+    env["GROQ_BASE_URL"] = f"http://127.0.0.1:{args.stub_port}/openai/v1"
+    env.setdefault("GROQ_API_KEY", "stub")
+
+    stub = _start([sys.executable, "-m", "uvicorn", "benchmarks.stub_groq:app", "--port", str(args.stub_port),
+                   "--log-level", "warning"], env)
+    server = _start([sys.executable, "-m", "uvicorn", "benchmarks.loadtest_server:app", "--port", str(args.port),
+                     "--log-level", "warning"], env)
+    base_url = f"http://127.0.0.1:{args.port}"
+    image_url = f"http://127.0.0.1:{args.stub_port}/image.jpg"
+
+    def image_payload(i):
+        # The image is the same every time; the query makes each request unique
+        return {"image_url": image_url, "query": f"What is in this picture? #{i}"}
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "concurrency": args.concurrency,
+            "requests": args.requests,
+            "unique_payloads": not args.allow_cache,
+            "models": {key: env[key] for key in ("SUMMARIZER_MODEL", "PARAPHRASER_MODEL", "LIT_REVIEW_MODEL")},
+        },
+        "routes": {},
+    }
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    try:
+        async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+            await _wait_healthy(client, f"http://127.0.0.1:{args.stub_port}/image.jpg", stub)
+            await _wait_healthy(client, f"{base_url}/healthz", server)
+            for route in args.routes:
+                payload_for = image_payload if route == "image" else None
+                result = await drive(client, base_url, route, server.pid, args.concurrency, args.requests,
+                                     args.warmup, payload_for, unique=not args.allow_cache)
+                report["routes"][route] = result
+                print(f"{route:<14} {result['rps']:>8} rps  p50 {result['p50_ms']}  p95 {result['p95_ms']}  "
+                      f"p99 {result['p99_ms']} ms  errors {result['errors']}  rss {result['peak_rss_mb']} MB")
+        report["peak_rss_mb"] = round(rss_kb(server.pid, "VmHWM") / 1024, 1)
+    finally:
+        for process in (server, stub):
+            process.terminate()
+            process.wait(timeout=30)
+
+    print(f"server peak RSS {report['peak_rss_mb']} MB")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    def change(old, new):
+        return (new - old) / old if old and new is not None else None
+
+    regressions = []
+    print(f"{'route':<14} {'p50':>16} {'p95':>16} {'p99':>16} {'rps':>16} {'peak RSS':>16}")
+    for route, new in candidate["routes"].items():
+        old = baseline["routes"].get(route)
+        if old is None:
+            print(f"{route:<14} (not in baseline)")
+            continue
+        cells = []
+        for metric in ("p50_ms", "p95_ms", "p99_ms", "rps", "peak_rss_mb"):
+            delta = change(old[metric], new[metric])
+            cells.append(f"{new[metric]} ({delta:+.0%})" if delta is not None else str(new[metric]))
+        print(f"{route:<14} " + " ".join(f"{cell:>16}" for cell in cells))
+
+        p95_change = change(old["p95_ms"], new["p95_ms"])
+        rps_change = change(old["rps"], new["rps"])
+        if p95_change is not None and p95_change > args.threshold:
+            regressions.append(f"{route}: p95 {p95_change:+.0%}")
+        if rps_change is not None and rps_change < -args.threshold:
+            regressions.append(f"{route}: rps {rps_change:+.0%}")
+
+    if regressions:
+        sys.exit("regressions over the threshold: " + ", ".join(regressions))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="start the stubbed app and load test it")
+    run_parser.add_argument("--routes", nargs="+", choices=list(ROUTES), default=list(ROUTES))
+    run_parser.add_argument("--concurrency", type=int, default=8)
+    run_parser.add_argument("--requests", type=int, default=200, help="measured requests per route")
+    run_parser.add_argument("--warmup", type=int, default=3, help="unmeasured requests per route")
+    run_parser.add_argument("--port", type=int, default=8810)
+    run_parser.add_argument("--stub-port", type=int, default=8900)
+    run_parser.add_argument("--upstream-latency-ms", type=float, default=50, help="Groq / Gemini stub delay")
+    run_parser.add_argument("--timeout", type=float, default=300)
+    run_parser.add_argument("--allow-cache", action="store_true", help="repeat identical payloads")
+    run_parser.add_argument("--output", help="write the report as JSON to this file")
+
+    compare_parser = subparsers.add_parser("compare", help="compare two reports")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="allowed relative regression")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        asyncio.run(run(args))
+    else:
+        compare(args)
+
+
+if __name__ == "__main__":
+    main()
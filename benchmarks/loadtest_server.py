@@ -0,0 +1,11 @@
+from app import imagetotext
+from benchmarks.stub_gemini import StubVisionClient
+from main import app
+
+# The app as served by the load test: identical to main:app except that
+# Gemini is replaced by the local stub. Groq is redirected with GROQ_BASE_URL
+# and the models with SUMMARIZER_MODEL / PARAPHRASER_MODEL / LIT_REVIEW_MODEL,
+# which benchmarks/loadtest.py sets before starting it.
+imagetotext.set_vision_client(StubVisionClient())
+
+__all__ = ["app"]
@@ -0,0 +1,26 @@
+import asyncio
+import os
+
+# Local stand-in for the Gemini vision client, for testing and benchmarking
+# without the network. It has the same interface as
+# app.imagetotext.GeminiVisionClient and is installed with set_vision_client();
+# benchmarks/loadtest_server.py does that for the load test.
+#
+# STUB_GEMINI_LATENCY_MS adds a fixed delay per call.
+STUB_GEMINI_LATENCY_MS = float(os.getenv("STUB_GEMINI_LATENCY_MS", "200"))
+
+
+class StubVisionClient:
+    model_name = "stub-gemini"
+
+    def __init__(self, latency_ms: float = STUB_GEMINI_LATENCY_MS):
+        self.latency = latency_ms / 1000
+        self.calls = 0
+
+    async def describe_and_answer(self, image_bytes: bytes, mime_type: str, query: str) -> dict:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return {
+            "description": f"A stubbed {mime_type} image of {len(image_bytes)} bytes.",
+            "answer": f"Stubbed answer to: {query}",
+        }
@@ -0,0 +1,65 @@
+import asyncio
+import json
+import os
+import random
+from io import BytesIO
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+# Local stand-in for the Groq chat completions API, for testing and
+# benchmarking without the network. Run it and point the backend at it:
+#
+#   uvicorn benchmarks.stub_groq:app --port 8900
+#   GROQ_BASE_URL=http://127.0.0.1:8900/openai/v1 uvicorn main:app
+#
+# STUB_LATENCY_MS adds a fixed upstream delay, STUB_ERROR_RATE makes that
+# fraction of calls fail with 429 + Retry-After (exercises the retry path).
+# Streaming requests emit one word every STUB_TOKEN_MS. GET /image.jpg serves
+# a generated test image for /image-to-text.
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "50"))
+STUB_ERROR_RATE = float(os.getenv("STUB_ERROR_RATE", "0"))
+STUB_TOKEN_MS = float(os.getenv("STUB_TOKEN_MS", "5"))
+STUB_REPLY = os.getenv("STUB_REPLY", "Dear reader, this is a stubbed completion from the local test server.")
+
+app = FastAPI()
+_image = None
+
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(body: dict):
+    await asyncio.sleep(STUB_LATENCY_MS / 1000)
+    if random.random() < STUB_ERROR_RATE:
+        return JSONResponse({"error": {"message": "rate limited"}}, status_code=429, headers={"Retry-After": "0.1"})
+
+    if body.get("stream"):
+        return StreamingResponse(_stream_reply(body.get("model")), media_type="text/event-stream")
+
+    return {
+        "id": "stub",
+        "object": "chat.completion",
+        "model": body.get("model"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": STUB_REPLY}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 0, "completion_tokens": len(STUB_REPLY.split()), "total_tokens": 0},
+    }
+
+
+async def _stream_reply(model):
+    for word in STUB_REPLY.split(" "):
+        await asyncio.sleep(STUB_TOKEN_MS / 1000)
+        chunk = {"id": "stub", "object": "chat.completion.chunk", "model": model,
+                 "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]}
+        yield f"data: {json.dumps(chunk)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.get("/image.jpg")
+async def image():
+    global _image
+    if _image is None:
+        from PIL import Image
+
+        out = BytesIO()
+        Image.radial_gradient("L").resize((1600, 1200)).convert("RGB").save(out, format="JPEG", quality=90)
+        _image = out.getvalue()
+    return Response(_image, media_type="image/jpeg")
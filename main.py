@@ -1,3 +1,4 @@
+from app import resources  # first: keeps Hugging Face offline unless downloads are allowed
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.email_gen import router as email_gen_router
@@ -7,6 +8,13 @@ from app.summarizer import router as summarizer_router
 from app.paraphraser import router as paraphraser_router
 from app.literature_review import router as literature_review_router
 from app.tone_enhancer import router as tone_enhancer_router
+from app import inference, groq_client, extraction, imagetotext
+from app.languagetool_pool import pool as languagetool_pool
+from app.model_registry import registry, MODEL_PRELOAD
+import asyncio
+from app.stats import router as stats_router
+from app import health, jobs
+from app.metrics import MetricsMiddleware, router as metrics_router
 
 app = FastAPI()
 
@@ -19,6 +27,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request and per-stage timings for GET /metrics (and opt-in Server-Timing)
+app.add_middleware(MetricsMiddleware)
+
 # Include the email generation router
 app.include_router(email_gen_router, prefix="/email", tags=["Email Generation"])
 
@@ -34,4 +45,40 @@ app.include_router(paraphraser_router, prefix="/paraphraser", tags=["Text Paraph
 
 app.include_router(literature_review_router, prefix="/lit", tags=["Literature Review Generator"])
 
-app.include_router(tone_enhancer_router, prefix="/tone", tags=["Tone enhancer"])
\ No newline at end of file
+app.include_router(tone_enhancer_router, prefix="/tone", tags=["Tone enhancer"])
+
+app.include_router(stats_router, prefix="/stats", tags=["Stats"])
+
+app.include_router(jobs.router, prefix="/jobs", tags=["Bulk Jobs"])
+
+app.include_router(health.router, tags=["Health"])
+
+app.include_router(metrics_router, tags=["Metrics"])
+
+
+@app.on_event("startup")
+async def preload_models():
+    # Models in MODEL_PRELOAD are loaded in the background without delaying
+    # startup; everything else loads on first use. WARMUP_MODELS are then
+    # warmed up, and /readyz reports ready once they all are.
+    asyncio.ensure_future(registry.preload())
+    if "languagetool" in MODEL_PRELOAD or "all" in MODEL_PRELOAD:
+        asyncio.ensure_future(languagetool_pool.start())
+    health.start_warm_up()
+    # Bulk jobs run in separate worker processes (JOBS_WORKERS, 0 to run
+    # `python -m app.jobs worker` yourself)
+    jobs.start_workers()
+
+
+@app.on_event("shutdown")
+def shutdown_inference_pools():
+    inference.shutdown()
+    extraction.shutdown()
+    languagetool_pool.close()
+    jobs.stop_workers()
+
+
+@app.on_event("shutdown")
+async def close_upstream_clients():
+    await groq_client.aclose()
+    await imagetotext.aclose()